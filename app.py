@@ -1,11 +1,37 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 import os
 from book_meeting.src.meeting import meet
+from book_meeting.helper.outbox import start_outbox_workers, stop_outbox_workers
+from book_meeting.helper.log_shipper import log_shipper
+from book_meeting.config.indexes import ensure_indexes, verify_query_plans
+from book_meeting.helper.migrations import run_migrations
+from book_meeting.helper.archiver import start_archiver, stop_archiver
+from book_meeting.helper.local_cache import start_invalidation_listener, stop_invalidation_listener
 from fastapi.middleware.cors import CORSMiddleware
 from scalar_fastapi import get_scalar_api_reference
 from starlette.middleware.sessions import SessionMiddleware
 
-app=FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await ensure_indexes()
+    if os.getenv("VERIFY_QUERY_PLANS", "false").lower() == "true":
+        await verify_query_plans() # refuses to start if a hot query would scan a collection
+    migration = asyncio.create_task(run_migrations()) # batched starts_at backfill, range reads match by meeting_date until it is done
+    log_shipper.start() # batched log shipping
+    start_outbox_workers() # background email delivery
+    start_archiver() # moves past meetings to temp_meeting
+    start_invalidation_listener() # drops local cache entries invalidated by other workers
+    yield
+    await stop_invalidation_listener()
+    migration.cancel()
+    await stop_archiver()
+    await stop_outbox_workers()
+    await log_shipper.stop()
+
+app=FastAPI(lifespan=lifespan)
 app.include_router(meet)
 app.add_middleware(
     CORSMiddleware,
@@ -22,4 +48,4 @@ def get_scalar_docs():
     return get_scalar_api_reference(
         openapi_url=app.openapi_url,
         title="Scalar API"
-    )
\ No newline at end of file
+    )
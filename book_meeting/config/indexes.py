@@ -0,0 +1,99 @@
+import logging
+from datetime import datetime
+from pymongo import ASCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from .database import conn
+from ..helper.migrations import starts_between
+
+logger = logging.getLogger("meeting_log")
+
+# every index the hot queries rely on, create_indexes is a no-op for ones that already exist
+INDEXES = {
+    (conn.booking, "meeting"): [
+        IndexModel([("meeting_id", ASCENDING)], unique=True, name="meeting_id_unique"),
+        IndexModel([("UID", ASCENDING), ("meeting_date", ASCENDING), ("full_name", ASCENDING)], name="uid_date_name"),
+        IndexModel([("email", ASCENDING), ("meeting_date", ASCENDING), ("meeting_time", ASCENDING)], name="email_date_time"),
+        IndexModel([("UID", ASCENDING), ("starts_at", ASCENDING)], name="uid_starts_at"),
+        IndexModel([("email", ASCENDING), ("starts_at", ASCENDING), ("meeting_id", ASCENDING)], name="email_starts_at_meeting_id"),
+        IndexModel([("starts_at", ASCENDING), ("meeting_id", ASCENDING)], name="starts_at_meeting_id"),
+    ],
+    (conn.booking, "temp_meeting"): [
+        IndexModel([("meeting_id", ASCENDING)], name="meeting_id"),
+        IndexModel([("email", ASCENDING), ("meeting_date", ASCENDING), ("meeting_time", ASCENDING)], name="email_date_time"),
+        IndexModel([("UID", ASCENDING), ("starts_at", ASCENDING)], name="uid_starts_at"),
+        IndexModel([("email", ASCENDING), ("starts_at", ASCENDING), ("meeting_id", ASCENDING)], name="email_starts_at_meeting_id"),
+    ],
+    (conn.booking, "meeting_counter"): [
+        IndexModel([("UID", ASCENDING), ("full_name", ASCENDING), ("meeting_date", ASCENDING)], unique=True, name="uid_name_date_unique"),
+    ],
+    (conn.booking, "email_outbox"): [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="status_next_attempt"),
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease"),
+        IndexModel([("meeting_id", ASCENDING)], name="meeting_id"),
+    ],
+    (conn.public_profile_data, "user"): [
+        IndexModel([("UID", ASCENDING)], name="uid"),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    (conn.auth, "user"): [
+        IndexModel([("UID", ASCENDING), ("full_name", ASCENDING)], name="uid_name"),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+}
+
+
+async def ensure_indexes():
+    """Idempotently create the indexes one at a time, a failing index is logged and the rest still get built"""
+    failed = []
+    for (db, name), indexes in INDEXES.items():
+        for index in indexes:
+            index_name = index.document["name"]
+            try:
+                await db[name].create_indexes([index])
+                logger.info(f"Index ready on {db.name}.{name}: {index_name}")
+            except OperationFailure as e:
+                # e.g. duplicate meeting_ids in legacy data block meeting_id_unique
+                logger.error(f"Could not create index {index_name} on {db.name}.{name}: {str(e)}")
+                failed.append(f"{db.name}.{name}.{index_name}")
+    if failed:
+        logger.error(f"Indexes missing, the queries relying on them will scan: {', '.join(failed)}")
+    return failed
+
+
+def hot_queries():
+    """(description, cursor) for every query that must be served by an index"""
+    return [
+        ("meeting by meeting_id", conn.booking.meeting.find({"meeting_id": "0"})),
+        ("meetings by UID and date", conn.booking.meeting.find({"UID": "0", "meeting_date": "01-01-2025"})),
+        ("meetings by full_name, UID and date", conn.booking.meeting.find({"full_name": "0", "UID": "0", "meeting_date": "01-01-2025"})),
+        ("meetings by UID in a date range", conn.booking.meeting.find({"UID": "0", **starts_between(datetime(2025, 1, 1), datetime(2025, 4, 1))})),
+        ("meeting page by email after a cursor", conn.booking.meeting.find({"email": "0", "$or": [{"starts_at": {"$gt": datetime(2025, 1, 1)}}, {"starts_at": datetime(2025, 1, 1), "meeting_id": {"$gt": "0"}}]}).sort([("starts_at", 1), ("meeting_id", 1)]).limit(21)),
+        ("meeting export by UID sorted by start", conn.booking.meeting.find({"UID": "0"}).sort("starts_at", 1)),
+        ("meetings before the archive cutoff, oldest first", conn.booking.meeting.find({"starts_at": {"$lt": datetime(2025, 1, 1)}}).sort([("starts_at", 1), ("meeting_id", 1)])),
+        ("archived meeting export by UID in a date range", conn.booking.temp_meeting.find({"UID": "0", **starts_between(datetime(2025, 1, 1), datetime(2025, 4, 1))}).sort("starts_at", 1)),
+        ("previous meeting page by email", conn.booking.temp_meeting.find({"email": "0"}).sort([("starts_at", 1), ("meeting_id", 1)]).limit(21)),
+        ("meeting counter", conn.booking.meeting_counter.find({"UID": "0", "full_name": "0", "meeting_date": "01-01-2025"})),
+        ("profile by UID", conn.public_profile_data.user.find({"UID": "0"})),
+        ("auth user by UID and full_name", conn.auth.user.find({"full_name": "0", "UID": "0"})),
+        ("auth user by email", conn.auth.user.find({"email": "0"})),
+    ]
+
+
+def _has_stage(plan, stage: str):
+    if isinstance(plan, dict):
+        return plan.get("stage") == stage or any(_has_stage(value, stage) for value in plan.values())
+    if isinstance(plan, list):
+        return any(_has_stage(item, stage) for item in plan)
+    return False
+
+
+async def verify_query_plans():
+    """Explain every hot query and raise if any of them would do a COLLSCAN"""
+    collscans = []
+    for description, cursor in hot_queries():
+        plan = await cursor.explain()
+        if _has_stage(plan.get("queryPlanner", {}).get("winningPlan", {}), "COLLSCAN"):
+            collscans.append(description)
+    if collscans:
+        raise RuntimeError(f"Hot queries are not covered by an index: {', '.join(collscans)}")
+    logger.info("All hot queries use an index")
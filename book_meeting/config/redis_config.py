@@ -3,4 +3,9 @@ import aioredis
 # redis connection
 # client = aioredis.from_url('redis://default@54.162.195.191:6379', decode_responses=True) #in production
 
-client =  aioredis.from_url('redis://localhost', decode_responses=True) # in local testing
\ No newline at end of file
+client =  aioredis.from_url('redis://localhost', decode_responses=True) # in local testing
+
+# raw bytes client for bitmaps, decode_responses would break binary values
+# binary_client = aioredis.from_url('redis://default@54.162.195.191:6379', decode_responses=False) #in production
+
+binary_client = aioredis.from_url('redis://localhost', decode_responses=False) # in local testing
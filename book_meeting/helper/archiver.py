@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from ..config.database import conn
+from ..config.redis_config import client
+from .bulk import archive_meetings, ARCHIVE_BATCH_SIZE
+from .listing import after_cursor
+
+logger = logging.getLogger("meeting_log")
+
+# Periodically moves meetings that started more than ARCHIVE_AFTER_DAYS ago from booking.meeting
+# to booking.temp_meeting so the hot collection only holds the booking horizon.
+
+ARCHIVE_ENABLED = os.getenv("ARCHIVE_ENABLED", "true").lower() == "true"
+ARCHIVE_INTERVAL = int(os.getenv("ARCHIVE_INTERVAL", 3600))  # seconds between runs
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 1))
+ARCHIVE_PAUSE = float(os.getenv("ARCHIVE_PAUSE", 0.5))  # seconds between batches
+ARCHIVE_LOCK_KEY = "meeting_archiver_lock"
+CHECKPOINT_ID = "meeting_archiver"
+
+checkpoints = conn.booking.job_checkpoint
+_task: Optional[asyncio.Task] = None
+
+
+async def get_checkpoint():
+    return await checkpoints.find_one({"_id": CHECKPOINT_ID}, {"_id": 0})
+
+
+async def _save_checkpoint(fields: dict):
+    await checkpoints.update_one({"_id": CHECKPOINT_ID}, {"$set": {**fields, "updated_at": datetime.utcnow()}}, upsert=True)
+
+
+async def archive_past_meetings(batch_size: int = ARCHIVE_BATCH_SIZE):
+    """One archiver run, returns the number of meetings moved.
+
+    An interrupted run leaves running=True in its checkpoint and the next run resumes with the
+    same cutoff after the last meeting it reached. Each batch starts after the previous one, so
+    meetings that fail to copy are logged and skipped for the rest of the run instead of being
+    picked up again as the oldest batch, the next run retries them once.
+    """
+    checkpoint = await get_checkpoint() or {}
+    if checkpoint.get("running") and checkpoint.get("cutoff"):
+        cutoff = checkpoint["cutoff"]
+        archived = checkpoint.get("archived_in_run", 0)
+        failed = checkpoint.get("failed_in_run", 0)
+        position = (checkpoint["last_starts_at"], checkpoint["last_meeting_id"]) if checkpoint.get("last_meeting_id") else None
+        logger.info(f"Resuming archive run with cutoff {cutoff}")
+    else:
+        cutoff = datetime.combine(datetime.now().date(), datetime.min.time()) - timedelta(days=ARCHIVE_AFTER_DAYS)
+        archived, failed, position = 0, 0, None
+        await _save_checkpoint({"running": True, "cutoff": cutoff, "archived_in_run": 0, "failed_in_run": 0,
+                                "last_starts_at": None, "last_meeting_id": None, "run_started_at": datetime.utcnow()})
+
+    while True:
+        query = {"starts_at": {"$lt": cutoff}}
+        if position:
+            query.update(after_cursor(*position))
+        meetings = await conn.booking.meeting.find(query) \
+            .sort([("starts_at", 1), ("meeting_id", 1)]).limit(batch_size).to_list(length=None)
+        if not meetings:
+            break
+        last = meetings[-1]
+        moved, not_copied = await archive_meetings(meetings, done_status=None)
+        archived += len(moved)
+        failed += len(not_copied)
+        position = (last["starts_at"], last["meeting_id"])
+        await _save_checkpoint({"archived_in_run": archived, "failed_in_run": failed,
+                                "last_starts_at": last["starts_at"], "last_meeting_id": last["meeting_id"]})
+        await asyncio.sleep(ARCHIVE_PAUSE)  # rate limit, keeps the primary free for user traffic
+
+    await checkpoints.update_one(
+        {"_id": CHECKPOINT_ID},
+        {"$set": {"running": False, "run_finished_at": datetime.utcnow(), "updated_at": datetime.utcnow()},
+         "$inc": {"archived_total": archived}},
+        upsert=True
+    )
+    logger.info(f"Archived {archived} meetings that started before {cutoff}, {failed} could not be archived")
+    return archived
+
+
+async def _run():
+    while True:
+        try:
+            # one run per interval across every worker process
+            if await client.set(ARCHIVE_LOCK_KEY, os.getpid(), nx=True, ex=ARCHIVE_INTERVAL):
+                await archive_past_meetings()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Archive run failed: {str(e)}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
+
+def start_archiver():
+    global _task
+    if ARCHIVE_ENABLED and _task is None:
+        _task = asyncio.create_task(_run())
+        logger.info(f"Meeting archiver started, every {ARCHIVE_INTERVAL}s for meetings older than {ARCHIVE_AFTER_DAYS} days")
+
+
+async def stop_archiver():
+    global _task
+    if _task is None:
+        return
+    _task.cancel()
+    try:
+        await _task
+    except asyncio.CancelledError:
+        pass
+    _task = None
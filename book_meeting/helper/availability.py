@@ -0,0 +1,487 @@
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from ..config.database import conn
+from ..config.redis_config import binary_client
+from .cache import jittered
+from .conflicts import has_conflict, meeting_minutes, slot_index_key
+from .events import on, BOOKED, CANCELLED, ARCHIVED
+from .migrations import starts_between
+from .schedule import CompiledSchedule, get_schedule
+from .single_flight import refresh_in_background, single_flight
+
+logger = logging.getLogger("meeting_log")
+
+# Free slots per user and day are stored as a bitmap, bit i set means slot i of that
+# day's grid in the compiled schedule is free. Keys carry the schedule version so a profile
+# change retires the old bitmaps instead of reading them against a different grid. The window
+# marker holds the window's soft expiry, past it the bitmaps are served and rebuilt in the background.
+# Every booking write bumps the user's generation, a rebuild only stores its bitmaps if the
+# generation it read before querying Mongo is still current.
+
+AVAILABILITY_WINDOW_DAYS = 90
+AVAILABILITY_TTL = 8 * 24 * 60 * 60
+AVAILABILITY_SOFT_TTL = int(os.getenv("AVAILABILITY_SOFT_TTL", 3600))  # seconds
+MAX_RANGE_DAYS = 92
+MINUTES_PER_DAY = 24 * 60
+MAX_PARTICIPANTS = 50
+SEARCH_CHUNK_DAYS = 7
+SEARCH_HORIZON_DAYS = int(os.getenv("SEARCH_HORIZON_DAYS", 180))
+BUILD_ATTEMPTS = 3
+
+# Clear the bits of the slots a new booking blocks, only if the day is materialised
+BOOK_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV do
+    redis.call('SETBIT', KEYS[1], tonumber(ARGV[i]), 0)
+end
+return 1
+"""
+
+# Free the slots a removed booking blocked unless another booking in KEYS[2] still blocks them.
+# ARGV = duration, then (bit, slot minute) pairs. Without the booking set the bitmap is dropped
+# and rebuilt on the next read.
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+if redis.call('EXISTS', KEYS[2]) == 0 then
+    redis.call('DEL', KEYS[1])
+    return -1
+end
+if redis.call('ZCOUNT', KEYS[2], '+inf', '+inf') > 0 then
+    return 1
+end
+local duration = tonumber(ARGV[1])
+for i = 2, #ARGV, 2 do
+    local slot = tonumber(ARGV[i + 1])
+    if redis.call('ZCOUNT', KEYS[2], '(' .. (slot - duration), '(' .. (slot + duration)) == 0 then
+        redis.call('SETBIT', KEYS[1], tonumber(ARGV[i]), 1)
+    end
+end
+return 1
+"""
+# Store rebuilt bitmaps only if no booking write happened since the rebuild read Mongo.
+# KEYS = generation, then the keys to set; ARGV = expected generation, then (value, ttl) per key
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+for i = 2, #KEYS do
+    redis.call('SET', KEYS[i], ARGV[i * 2 - 2], 'EX', ARGV[i * 2 - 1])
+end
+return 1
+"""
+book_script = binary_client.register_script(BOOK_SCRIPT)
+store_script = binary_client.register_script(STORE_SCRIPT)
+release_script = binary_client.register_script(RELEASE_SCRIPT)
+
+
+def availability_key(schedule: CompiledSchedule, date: str):
+    return f"availability:{schedule.UID}:{schedule.version}:{date}"
+
+
+def window_key(schedule: CompiledSchedule):
+    return f"availability_window:{schedule.UID}:{schedule.version}"
+
+
+def generation_key(UID: str):
+    return f"availability_generation:{UID}"
+
+
+async def _generations(UIDs: List[str]):
+    values = await binary_client.mget([generation_key(UID) for UID in UIDs])
+    return {UID: value or b"0" for UID, value in zip(UIDs, values)}
+
+
+def _store_args(UID: str, generation: bytes, entries: List[Tuple[str, bytes, int]]):
+    """keys and args of store_script for (key, value, ttl) entries"""
+    args = [generation]
+    for _, value, ttl in entries:
+        args.extend([value, ttl])
+    return [generation_key(UID)] + [key for key, _, _ in entries], args
+
+
+def encode_bitmap(free: List[bool]):
+    """Pack booleans MSB first, the same bit order Redis SETBIT/GETBIT use"""
+    data = bytearray((len(free) + 7) // 8)
+    for i, is_free in enumerate(free):
+        if is_free:
+            data[i >> 3] |= 0x80 >> (i & 7)
+    return bytes(data)
+
+
+def decode_bitmap(data: bytes, slots: List[int]):
+    """Minute offsets of the free slots"""
+    free = []
+    for i, slot in enumerate(slots):
+        if (i >> 3) < len(data) and data[i >> 3] & (0x80 >> (i & 7)):
+            free.append(slot)
+    return free
+
+
+def format_minutes(minutes: int):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def day_bitmap(slots: List[int], duration: int, starts: List[Optional[int]]):
+    """None in starts is a meeting whose time can't be parsed, nothing that day is free"""
+    if None in starts:
+        return encode_bitmap([False] * len(slots))
+    starts = sorted(starts)
+    return encode_bitmap([not has_conflict(starts, slot, duration) for slot in slots])
+
+
+def day_response(schedule: CompiledSchedule, date: str, bitmap: Optional[bytes]):
+    message = schedule.closed_message(date)
+    if message:
+        return {"UID": schedule.UID, "date": date, "message": message, "available_slots": []}
+    return {
+        "UID": schedule.UID,
+        "date": date,
+        "working_hours": schedule.working_hours,
+        "working_days": [day.capitalize() for day in schedule.working_days],
+        "holidays": [day.capitalize() for day in schedule.holiday_days] + sorted(schedule.holiday_dates),
+        "working_address": schedule.working_address,
+        "avg_meeting_duration": schedule.avg_meeting_duration,
+        "available_slots": [format_minutes(slot) for slot in decode_bitmap(bitmap or b"", schedule.slots_for(date))]
+    }
+
+
+async def _booked_starts(UID: str, start: datetime, end: datetime) -> Dict[str, List[int]]:
+    """Start minutes of every meeting in [start, end) grouped by date, one indexed range query"""
+    meetings = await conn.booking.meeting.find(
+        {"UID": UID, **starts_between(start, end)},
+        {"meeting_id": 1, "meeting_date": 1, "meeting_time": 1}
+    ).to_list(length=None)
+    starts = defaultdict(list)
+    for meeting in meetings:
+        starts[meeting["meeting_date"]].append(meeting_minutes(meeting))
+    return starts
+
+
+async def build_availability(schedule: CompiledSchedule):
+    """Precompute the bitmaps of the whole window for the schedule's version"""
+    UID = schedule.UID
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    for _ in range(BUILD_ATTEMPTS):
+        generation = (await _generations([UID]))[UID]
+        starts = await _booked_starts(UID, today, today + timedelta(days=AVAILABILITY_WINDOW_DAYS))
+        entries = []
+        for offset in range(AVAILABILITY_WINDOW_DAYS):
+            date = (today + timedelta(days=offset)).strftime("%d-%m-%Y")
+            bitmap = day_bitmap(schedule.slots_for(date), schedule.avg_meeting_duration, starts.get(date, []))
+            entries.append((availability_key(schedule, date), bitmap, jittered(AVAILABILITY_TTL)))
+        entries.append((window_key(schedule), int(time.time()) + jittered(AVAILABILITY_SOFT_TTL), jittered(AVAILABILITY_TTL)))
+        keys, args = _store_args(UID, generation, entries)
+        if await store_script(keys=keys, args=args):
+            logger.info(f"Availability precomputed for {UID} for {AVAILABILITY_WINDOW_DAYS} days")
+            return
+    logger.warning(f"Availability for {UID} kept changing while it was rebuilt, left for the next read")
+
+
+async def build_day(schedule: CompiledSchedule, date: str):
+    """Materialise a single day, used for days outside the precomputed window or after expiry"""
+    day = datetime.strptime(date, "%d-%m-%Y")
+    for _ in range(BUILD_ATTEMPTS):
+        generation = (await _generations([schedule.UID]))[schedule.UID]
+        starts = await _booked_starts(schedule.UID, day, day + timedelta(days=1))
+        bitmap = day_bitmap(schedule.slots_for(date), schedule.avg_meeting_duration, starts.get(date, []))
+        keys, args = _store_args(schedule.UID, generation, [(availability_key(schedule, date), bitmap, jittered(AVAILABILITY_TTL))])
+        if await store_script(keys=keys, args=args):
+            break
+    return bitmap
+
+
+async def _schedule_for_read(UID: str):
+    """Compiled schedule or None if the user doesn't exist, KeyError when there is nothing to compile"""
+    schedule = await get_schedule(UID)
+    if schedule is not None and not schedule.configured:
+        raise KeyError("Working time not configured for user")
+    return schedule
+
+
+async def _window_ready(key: str):
+    return await binary_client.exists(key) or None
+
+
+def revalidate_window(schedule: CompiledSchedule, window: bytes):
+    """Rebuild the window in the background once the marker's soft expiry has passed"""
+    try:
+        soft_expires = float(window)
+    except ValueError:
+        soft_expires = 0  # marker written before soft expiry existed
+    if soft_expires <= time.time():
+        refresh_in_background(window_key(schedule), lambda: build_availability(schedule))
+
+
+async def get_window_availability(UID: str, dates: List[str]):
+    """Free slots for many days with a single MGET, missing days are built on the spot"""
+    schedule = await _schedule_for_read(UID)
+    if schedule is None:
+        return None
+    values = await binary_client.mget([window_key(schedule)] + [availability_key(schedule, date) for date in dates])
+    window, bitmaps = values[0], values[1:]
+    if window is None:
+        # one worker builds the window, concurrent misses wait for it
+        key = window_key(schedule)
+        await single_flight(key, lambda: build_availability(schedule), check=lambda: _window_ready(key))
+        bitmaps = await binary_client.mget([availability_key(schedule, date) for date in dates])
+    else:
+        revalidate_window(schedule, window)
+    days = {}
+    for date, bitmap in zip(dates, bitmaps):
+        if bitmap is None:
+            key = availability_key(schedule, date)
+            bitmap = await single_flight(key, lambda: build_day(schedule, date), check=lambda: binary_client.get(key))
+        days[date] = day_response(schedule, date, bitmap)
+    return days
+
+
+async def get_day_availability(UID: str, date: str):
+    """A day's free slots, None if the user doesn't exist"""
+    days = await get_window_availability(UID, [date])
+    return days[date] if days is not None else None
+
+
+def free_mask(slots: List[int], duration: int, starts: List[Optional[int]]):
+    """Vectorised has_conflict over the whole slot grid, True where the slot is free"""
+    grid = np.asarray(slots, dtype=np.int32)
+    if None in starts:
+        return np.zeros(len(grid), dtype=bool)
+    booked = np.sort(np.asarray(starts, dtype=np.int32))
+    if not len(booked):
+        return np.ones(len(grid), dtype=bool)
+    i = np.searchsorted(booked, grid - duration + 1)
+    clash = (i < len(booked)) & (booked[np.minimum(i, len(booked) - 1)] < grid + duration)
+    return ~clash
+
+
+def mask_from_bitmap(bitmap: bytes, size: int):
+    bits = np.unpackbits(np.frombuffer(bitmap, dtype=np.uint8))[:size].astype(bool)
+    return np.pad(bits, (0, size - len(bits)))
+
+
+async def _booked_starts_by_user(UIDs: List[str], start: datetime, end: datetime) -> Dict[Tuple[str, str], List[int]]:
+    """Start minutes of every meeting of UIDs in [start, end) grouped by (UID, date), one $in range query"""
+    meetings = await conn.booking.meeting.find(
+        {"UID": {"$in": UIDs}, **starts_between(start, end)},
+        {"UID": 1, "meeting_id": 1, "meeting_date": 1, "meeting_time": 1}
+    ).to_list(length=None)
+    starts = defaultdict(list)
+    for meeting in meetings:
+        starts[(meeting["UID"], meeting["meeting_date"])].append(meeting_minutes(meeting))
+    return starts
+
+
+async def load_masks(schedules: List[CompiledSchedule], dates: List[str]):
+    """Free slot masks keyed by (UID, date), cached bitmaps from one MGET and the rest from one range query"""
+    keys = [(schedule, date) for schedule in schedules for date in dates]
+    values = await binary_client.mget([window_key(schedule) for schedule in schedules] +
+                                      [availability_key(schedule, date) for schedule, date in keys])
+    windows, bitmaps = values[:len(schedules)], values[len(schedules):]
+    for schedule, window in zip(schedules, windows):
+        if window is not None:
+            revalidate_window(schedule, window)
+    masks, missing = {}, []
+    for (schedule, date), bitmap in zip(keys, bitmaps):
+        if bitmap is None:
+            missing.append((schedule, date))
+        else:
+            masks[(schedule.UID, date)] = mask_from_bitmap(bitmap, len(schedule.slots_for(date)))
+    if missing:
+        days = sorted({datetime.strptime(date, "%d-%m-%Y") for _, date in missing})
+        UIDs = sorted({schedule.UID for schedule, _ in missing})
+        generations = await _generations(UIDs)
+        starts = await _booked_starts_by_user(UIDs, days[0], days[-1] + timedelta(days=1))
+        entries = defaultdict(list)
+        for schedule, date in missing:
+            mask = free_mask(schedule.slots_for(date), schedule.avg_meeting_duration, starts.get((schedule.UID, date), []))
+            masks[(schedule.UID, date)] = mask
+            # np.packbits is MSB first like SETBIT, so the bitmap is shared with the single day endpoint
+            entries[schedule.UID].append((availability_key(schedule, date), np.packbits(mask).tobytes(), jittered(AVAILABILITY_TTL)))
+        # a user whose bookings changed meanwhile keeps the masks for this response only
+        pipe = binary_client.pipeline(transaction=False)
+        for UID, user_entries in entries.items():
+            keys, args = _store_args(UID, generations[UID], user_entries)
+            await store_script(keys=keys, args=args, client=pipe)
+        await pipe.execute()
+    return masks
+
+
+async def get_range_availability(UID: str, dates: List[str]):
+    """Free slots of consecutive days, cached bitmaps from one MGET and the rest from one range query"""
+    schedule = await _schedule_for_read(UID)
+    if schedule is None:
+        return None
+    masks = await load_masks([schedule], dates)
+
+    available_slots, closed = {}, {}
+    for date in dates:
+        message = schedule.closed_message(date)
+        if message:
+            closed[date] = message
+            continue
+        slots = np.asarray(schedule.slots_for(date), dtype=np.int32)
+        available_slots[date] = [format_minutes(int(slot)) for slot in slots[masks[(UID, date)]]]
+    return {
+        "UID": UID,
+        "from": dates[0],
+        "to": dates[-1],
+        "working_hours": schedule.working_hours,
+        "working_address": schedule.working_address,
+        "avg_meeting_duration": schedule.avg_meeting_duration,
+        "available_slots": available_slots,
+        "closed": closed
+    }
+
+
+def minute_mask(slots: List[int], mask, duration: int):
+    """Spread a user's free slots over a 1440 minute day, minute m is set when a free slot covers it"""
+    free = np.asarray(slots, dtype=np.int32)[mask]
+    edges = np.zeros(MINUTES_PER_DAY + 1, dtype=np.int32)
+    np.add.at(edges, np.minimum(free, MINUTES_PER_DAY), 1)
+    np.add.at(edges, np.minimum(free + duration, MINUTES_PER_DAY), -1)
+    return np.cumsum(edges[:MINUTES_PER_DAY]) > 0
+
+
+def common_starts(free_minutes, duration: int, candidates: List[int]):
+    """Candidate starts where duration consecutive minutes are free"""
+    if duration > MINUTES_PER_DAY or not candidates:
+        return []
+    covered = np.concatenate(([0], np.cumsum(free_minutes, dtype=np.int32)))
+    fits = (covered[duration:] - covered[:-duration]) == duration
+    starts = np.asarray(candidates, dtype=np.int32)
+    starts = starts[starts <= MINUTES_PER_DAY - duration]
+    return [int(start) for start in starts[fits[starts]]]
+
+
+async def get_common_availability(schedules: List[CompiledSchedule], dates: List[str], duration: Optional[int] = None):
+    """Slots where every user is free, per user day bitsets ANDed on a shared minute grid"""
+    duration = duration or max(schedule.avg_meeting_duration for schedule in schedules)
+    masks = await load_masks(schedules, dates)
+
+    common = {}
+    for date in dates:
+        free_minutes = np.ones(MINUTES_PER_DAY, dtype=bool)
+        for schedule in schedules:
+            free_minutes &= minute_mask(schedule.slots_for(date), masks[(schedule.UID, date)], schedule.avg_meeting_duration)
+            if not free_minutes.any():
+                break
+        # only starts on some participant's own slot grid are offered
+        candidates = sorted({slot for schedule in schedules for slot in schedule.slots_for(date)})
+        starts = common_starts(free_minutes, duration, candidates)
+        if starts:
+            common[date] = [format_minutes(start) for start in starts]
+    return {
+        "UIDs": [schedule.UID for schedule in schedules],
+        "from": dates[0],
+        "to": dates[-1],
+        "duration": duration,
+        "common_slots": common
+    }
+
+
+async def iter_free_slots(schedule: CompiledSchedule, start: datetime, horizon_days: int = SEARCH_HORIZON_DAYS):
+    """Yield (date, minute) of free slots in order, loading SEARCH_CHUNK_DAYS days at a time.
+
+    Holidays and days off are skipped from the schedule alone and never read.
+    """
+    now = datetime.now()
+    # days before today only hold slots that have already passed
+    start = datetime.combine(max(start.date(), now.date()), datetime.min.time())
+    for chunk_start in range(0, horizon_days, SEARCH_CHUNK_DAYS):
+        days = [start + timedelta(days=offset) for offset in range(chunk_start, min(chunk_start + SEARCH_CHUNK_DAYS, horizon_days))]
+        dates = [day.strftime("%d-%m-%Y") for day in days if schedule.slots_for(day.strftime("%d-%m-%Y"))]
+        if not dates:
+            continue
+        masks = await load_masks([schedule], dates)
+        for date in dates:
+            slots = np.asarray(schedule.slots_for(date), dtype=np.int32)[masks[(schedule.UID, date)]]
+            if date == now.strftime("%d-%m-%Y"):
+                slots = slots[slots > now.hour * 60 + now.minute]
+            for slot in slots:
+                yield date, int(slot)
+
+
+async def next_free_slots(UID: str, start: datetime, count: int, horizon_days: int = SEARCH_HORIZON_DAYS):
+    """First count free slots on or after start, None if the user doesn't exist"""
+    schedule = await _schedule_for_read(UID)
+    if schedule is None:
+        return None
+    found = []
+    async for date, slot in iter_free_slots(schedule, start, horizon_days):
+        found.append({"date": date, "time": format_minutes(slot)})
+        if len(found) >= count:
+            break
+    return {
+        "UID": UID,
+        "avg_meeting_duration": schedule.avg_meeting_duration,
+        "horizon_days": horizon_days,
+        "slots": found
+    }
+
+
+def _affected_slots(schedule: CompiledSchedule, meeting: dict):
+    """(bit, slot minute) for every slot the meeting blocks, None when its date or time can't be parsed"""
+    start = meeting_minutes(meeting)
+    if start is None:
+        return None
+    try:
+        slots = schedule.slots_for(meeting["meeting_date"])
+    except (KeyError, TypeError, ValueError):
+        logger.warning(f"Unparseable date {meeting.get('meeting_date')!r} on meeting {meeting.get('meeting_id')}")
+        return None
+    duration = schedule.avg_meeting_duration
+    return [(i, slot) for i, slot in enumerate(slots) if abs(slot - start) < duration]
+
+
+@on(BOOKED, CANCELLED, ARCHIVED, priority=40)
+async def _bump_generation(pipe, meeting: dict):
+    """Makes any availability or booked count rebuild that read Mongo before this write discard its result"""
+    pipe.incr(generation_key(meeting["UID"]))
+    pipe.expire(generation_key(meeting["UID"]), AVAILABILITY_TTL)
+
+
+@on(BOOKED, priority=40)
+async def _mark_booked(pipe, meeting: dict):
+    schedule = await get_schedule(meeting["UID"])
+    if not schedule:
+        return
+    affected = _affected_slots(schedule, meeting)
+    if affected is None:
+        # the day's bitmap is rebuilt on the next read, with the whole day booked
+        pipe.delete(availability_key(schedule, meeting["meeting_date"]))
+    elif affected:
+        await book_script(keys=[availability_key(schedule, meeting["meeting_date"])], args=[i for i, _ in affected], client=pipe)
+
+
+@on(CANCELLED, ARCHIVED, priority=40)
+async def _mark_released(pipe, meeting: dict):
+    """Runs after the booking left the booked_slots set so only the remaining bookings are checked"""
+    schedule = await get_schedule(meeting["UID"])
+    if not schedule:
+        return
+    affected = _affected_slots(schedule, meeting)
+    if affected is None:
+        # a meeting without a parseable time blocked the whole day, rebuild it from what is left
+        pipe.delete(availability_key(schedule, meeting["meeting_date"]))
+        return
+    args = [schedule.avg_meeting_duration]
+    for i, slot in affected:
+        args.extend([i, slot])
+    if len(args) > 1:
+        keys = [availability_key(schedule, meeting["meeting_date"]), slot_index_key(meeting["UID"], meeting["meeting_date"])]
+        await release_script(keys=keys, args=args, client=pipe)
+
+
+async def invalidate_day(UID: str, date: str):
+    schedule = await get_schedule(UID)
+    if schedule:
+        await binary_client.delete(availability_key(schedule, date))
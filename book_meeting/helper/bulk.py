@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import os
+from bisect import insort
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import List, Optional
+from fastapi import status
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
+from ..config.database import conn
+from .cache import pipeline
+from .conflicts import has_conflict, meeting_minutes, remove_bookings, reserve_slots, to_minutes, UNKNOWN_TIME
+from .events import prepare, queue_event, BOOKED, ARCHIVED
+from .ids import next_meeting_id
+from .migrations import starts_between
+from .outbox import enqueue_emails
+from .schedule import get_schedules
+from .utils import booking_confirmation_html, counter_filter, decrement_meeting_counter, increment_meeting_counter
+
+logger = logging.getLogger("meeting_log")
+
+# Batch versions of the booking write path, every step costs a fixed number of round trips
+# however many meetings are in the batch.
+
+BULK_MAX_ITEMS = 500
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))
+
+
+def _failed(index: int, status_code: int, detail: str):
+    return {"index": index, "status_code": status_code, "detail": detail}
+
+
+async def _stamp_meeting_numbers(forms: List[dict]):
+    """number_of_meetings for every form, one counter $inc per (UID, full_name, date) group"""
+    groups = defaultdict(list)
+    for form in forms:
+        groups[tuple(counter_filter(form).values())].append(form)
+    totals = await asyncio.gather(*(increment_meeting_counter(group[0], len(group)) for group in groups.values()))
+    for group, total in zip(groups.values(), totals):
+        for offset, form in enumerate(group):
+            form["number_of_meetings"] = total - len(group) + offset + 1
+
+
+async def _release_counters(forms: List[dict]):
+    groups = defaultdict(list)
+    for form in forms:
+        groups[tuple(counter_filter(form).values())].append(form)
+    await asyncio.gather(*(decrement_meeting_counter(group[0], len(group)) for group in groups.values()))
+
+
+async def book_meetings(items: List[dict]):
+    """Book many meetings, returns one result per item in the order given"""
+    results = [None] * len(items)
+
+    # formats first, nothing else is read for items that can't be parsed
+    pending = []
+    for i, item in enumerate(items):
+        try:
+            item["starts_at"] = datetime.strptime(f"{item['meeting_date']} {item['meeting_time']}", "%d-%m-%Y %H:%M")
+        except ValueError:
+            results[i] = _failed(i, status.HTTP_400_BAD_REQUEST, "Invalid date or time format. Please use DD-MM-YYYY and HH:MM")
+            continue
+        pending.append(i)
+    if not pending:
+        return results
+
+    # one $in read per collection
+    UIDs = sorted({items[i]["UID"] for i in pending})
+    emails = sorted({items[i]["email"] for i in pending})
+    schedules, auth_users = await asyncio.gather(
+        get_schedules(UIDs),
+        # one read of auth.user answers both the (full_name, UID) and the email checks
+        conn.auth.user.find(
+            {"$or": [{"UID": {"$in": UIDs}}, {"email": {"$in": emails}}]},
+            {"_id": 0, "UID": 1, "full_name": 1, "email": 1}
+        ).to_list(length=None)
+    )
+    named_users = {(user.get("full_name"), user.get("UID")) for user in auth_users}
+    known_emails = {user.get("email") for user in auth_users}
+
+    valid = []
+    for i in pending:
+        item = items[i]
+        if item["UID"] not in schedules or (item["full_name"], item["UID"]) not in named_users:
+            results[i] = _failed(i, status.HTTP_404_NOT_FOUND, "User not found, please choose a different user.")
+        elif item["email"] not in known_emails:
+            results[i] = _failed(i, status.HTTP_404_NOT_FOUND, "User not found")
+        else:
+            valid.append(i)
+    if not valid:
+        return results
+
+    # conflicts are checked in memory against one range read, earlier items in the batch win
+    days = {(items[i]["UID"], items[i]["meeting_date"]) for i in valid}
+    first_day = min(items[i]["starts_at"] for i in valid).replace(hour=0, minute=0)
+    last_day = max(items[i]["starts_at"] for i in valid).replace(hour=0, minute=0)
+    existing = await conn.booking.meeting.find(
+        {"UID": {"$in": sorted({UID for UID, _ in days})}, **starts_between(first_day, last_day + timedelta(days=1))},
+        {"UID": 1, "meeting_id": 1, "meeting_date": 1, "meeting_time": 1}
+    ).to_list(length=None)
+    booked = defaultdict(dict)
+    for meeting in existing:
+        if (meeting["UID"], meeting["meeting_date"]) in days:
+            minute = meeting_minutes(meeting)
+            booked[(meeting["UID"], meeting["meeting_date"])][meeting["meeting_id"]] = UNKNOWN_TIME if minute is None else minute
+    starts = {day: sorted(minutes.values()) for day, minutes in booked.items()}
+
+    accepted = []
+    for i in valid:
+        item = items[i]
+        day = (item["UID"], item["meeting_date"])
+        minute = to_minutes(item["meeting_time"])
+        day_starts = starts.setdefault(day, [])
+        if (day_starts and day_starts[-1] == UNKNOWN_TIME) or has_conflict(day_starts, minute, schedules[item["UID"]].avg_meeting_duration):
+            results[i] = _failed(i, status.HTTP_409_CONFLICT, "Meeting slot is too close to an existing meeting. Please choose a different time.")
+            continue
+        insort(starts[day], minute)
+        item["meeting_id"] = await next_meeting_id()
+        accepted.append(i)
+    if not accepted:
+        return results
+
+    # claim the slots in Redis too so single bookings racing the batch see them
+    reserved = await reserve_slots(
+        [(items[i]["UID"], items[i]["meeting_date"], items[i]["meeting_id"], items[i]["meeting_time"],
+          schedules[items[i]["UID"]].avg_meeting_duration) for i in accepted],
+        booked
+    )
+    claimed = []
+    for i, ok in zip(accepted, reserved):
+        if ok:
+            claimed.append(i)
+        else:
+            results[i] = _failed(i, status.HTTP_409_CONFLICT, "Meeting slot was booked by another request. Please choose a different time.")
+    if not claimed:
+        return results
+
+    forms = [items[i] for i in claimed]
+    for form in forms:
+        form["status"] = "false"
+    await _stamp_meeting_numbers(forms)
+
+    failed = {}
+    try:
+        await conn.booking.meeting.insert_many(forms, ordered=False)
+    except BulkWriteError as e:
+        failed = {error["index"]: error.get("errmsg", "Failed to book meeting") for error in e.details.get("writeErrors", [])}
+    except Exception:
+        await remove_bookings([(form["UID"], form["meeting_date"], form["meeting_id"]) for form in forms])
+        await _release_counters(forms)
+        raise
+
+    inserted = []
+    for position, (i, form) in enumerate(zip(claimed, forms)):
+        if position in failed:
+            results[i] = _failed(i, status.HTTP_500_INTERNAL_SERVER_ERROR, failed[position])
+        else:
+            results[i] = {"index": i, "status_code": status.HTTP_201_CREATED, "meeting_id": form["meeting_id"]}
+            inserted.append(form)
+    if failed:
+        lost = [forms[position] for position in failed]
+        await remove_bookings([(form["UID"], form["meeting_date"], form["meeting_id"]) for form in lost])
+        await _release_counters(lost)
+
+    # every cache in one MULTI, then the emails in one insert
+    pipe = pipeline()
+    for form in inserted:
+        await queue_event(pipe, BOOKED, form)
+    await pipe.execute()
+    await enqueue_emails([(form["email"], "Meeting Confirmation", booking_confirmation_html(form), form["meeting_id"]) for form in inserted])
+    logger.info(f"Bulk booking: {len(inserted)} of {len(items)} meetings booked")
+    return results
+
+
+async def archive_meetings(meetings: List[dict], done_status: Optional[str] = "true"):
+    """Move meetings from booking.meeting to booking.temp_meeting and drop their hot cache entries.
+
+    The copy is an upsert by _id, so a batch that fails half way can simply be run again, and only
+    the documents that were copied are deleted. Pass done_status=None to archive without touching
+    the status. Returns the meeting_ids that were moved and the documents that could not be copied.
+    """
+    if not meetings:
+        return [], []
+    now = datetime.utcnow()
+    for meeting in meetings:
+        if done_status is not None:
+            meeting["status"] = done_status
+            meeting["completed_at"] = now
+        meeting["archived_at"] = now
+    errors = {}
+    try:
+        await conn.booking.temp_meeting.bulk_write(
+            [ReplaceOne({"_id": meeting["_id"]}, meeting, upsert=True) for meeting in meetings], ordered=False)
+    except BulkWriteError as e:
+        errors = {error["index"]: error.get("errmsg", "Failed to archive meeting") for error in e.details.get("writeErrors", [])}
+
+    copied, failed = [], []
+    for position, meeting in enumerate(meetings):
+        if position in errors:
+            logger.error(f"Could not archive meeting {meeting.get('meeting_id')} ({meeting['_id']}): {errors[position]}")
+            failed.append(meeting)
+        else:
+            copied.append(meeting)
+    # every cache of every moved meeting in one MULTI, queued before the delete
+    pipe = await prepare(*[(ARCHIVED, meeting) for meeting in copied])
+    if copied:
+        await conn.booking.meeting.delete_many({"_id": {"$in": [meeting["_id"] for meeting in copied]}})
+    await pipe.execute()
+    return [meeting["meeting_id"] for meeting in copied], failed
+
+
+async def complete_meetings(meeting_ids: List[str]):
+    """Mark meetings done and archive them ARCHIVE_BATCH_SIZE at a time, returns (completed, failed, not_found)"""
+    meeting_ids = list(dict.fromkeys(meeting_ids))
+    completed, failed = [], []
+    for start in range(0, len(meeting_ids), ARCHIVE_BATCH_SIZE):
+        batch = meeting_ids[start:start + ARCHIVE_BATCH_SIZE]
+        meetings = await conn.booking.meeting.find({"meeting_id": {"$in": batch}}).to_list(length=None)
+        moved, not_moved = await archive_meetings(meetings)
+        completed.extend(moved)
+        failed.extend(meeting["meeting_id"] for meeting in not_moved)
+    found = set(completed) | set(failed)
+    logger.info(f"{len(completed)} meetings marked done and archived, {len(failed)} failed")
+    return completed, failed, [meeting_id for meeting_id in meeting_ids if meeting_id not in found]
@@ -0,0 +1,181 @@
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from ..config.database import conn
+from ..config.redis_config import client
+from .availability import generation_key
+from .cache import jittered
+from .events import on, BOOKED, CANCELLED, ARCHIVED
+from .migrations import starts_between
+from .schedule import CompiledSchedule
+from .single_flight import refresh_in_background, single_flight
+
+logger = logging.getLogger("meeting_log")
+
+# booked_count:{UID} is a hash of 'DD-MM-YYYY' -> number of meetings booked that day, kept current
+# with HINCRBY by every booking write. The slots each day offers come from the compiled schedule.
+# Past _soft_expires the hash is still served but rebuilt in the background to correct any drift.
+# A rebuild is only stored if the user's availability generation didn't move while it read Mongo.
+
+BUSY_WINDOW_DAYS = 90
+BOOKED_COUNT_TTL = 8 * 24 * 60 * 60
+READY_FIELD = "_ready"
+SOFT_EXPIRES_FIELD = "_soft_expires"
+BOOKED_COUNT_SOFT_TTL = int(os.getenv("BOOKED_COUNT_SOFT_TTL", 3600))  # seconds
+
+
+# Count a booking only in a built hash, one created here would have no TTL and miss the
+# day's other bookings. KEYS[1] = hash, ARGV = ready field, date, delta
+COUNT_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HINCRBY', KEYS[1], ARGV[2], ARGV[3])
+return 1
+"""
+count_script = client.register_script(COUNT_SCRIPT)
+
+# Replace the hash with a rebuild only if no booking write happened since the rebuild read Mongo,
+# shares the availability generation. KEYS = generation, hash; ARGV = expected generation, ttl,
+# then field/value pairs
+STORE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('DEL', KEYS[2])
+redis.call('HSET', KEYS[2], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+return 1
+"""
+store_script = client.register_script(STORE_SCRIPT)
+BUILD_ATTEMPTS = 3
+
+
+def booked_count_key(UID: str):
+    return f"booked_count:{UID}"
+
+
+async def queue_booked_count(pipe, UID: str, date: str, delta: int):
+    """Queue the day counter update on the pipeline that writes the meeting cache"""
+    await count_script(keys=[booked_count_key(UID)], args=[READY_FIELD, date, delta], client=pipe)
+
+
+@on(BOOKED, priority=20)
+async def _count_booking(pipe, meeting: dict):
+    await queue_booked_count(pipe, meeting["UID"], meeting["meeting_date"], 1)
+
+
+@on(CANCELLED, ARCHIVED, priority=20)
+async def _uncount_booking(pipe, meeting: dict):
+    await queue_booked_count(pipe, meeting["UID"], meeting["meeting_date"], -1)
+
+
+async def build_booked_counts(UID: str):
+    """Rebuild the counter hash with one aggregation over the window"""
+    # count every day the hash can still be asked about before it expires
+    window_start = datetime.combine(datetime.now().date(), datetime.min.time())
+    window_end = window_start + timedelta(days=BUSY_WINDOW_DAYS + 1) + timedelta(seconds=BOOKED_COUNT_TTL)
+    for _ in range(BUILD_ATTEMPTS):
+        generation = await client.get(generation_key(UID)) or "0"
+        fields = {READY_FIELD: "1", SOFT_EXPIRES_FIELD: int(time.time()) + jittered(BOOKED_COUNT_SOFT_TTL)}
+        counts = await conn.booking.meeting.aggregate([
+            {"$match": {"UID": UID, **starts_between(window_start, window_end)}},
+            {"$group": {"_id": "$meeting_date", "count": {"$sum": 1}}}
+        ]).to_list(length=None)
+        for day in counts:
+            fields[day["_id"]] = day["count"]
+
+        args = [generation, jittered(BOOKED_COUNT_TTL)]
+        for field, value in fields.items():
+            args.extend([field, value])
+        # the DEL drops increments that landed on a partial hash
+        if await store_script(keys=[generation_key(UID), booked_count_key(UID)], args=args):
+            logger.info(f"Booked day counters rebuilt for {UID}")
+            break
+    else:
+        logger.warning(f"Booked day counters for {UID} kept changing while they were rebuilt, left for the next read")
+    return {k: str(v) for k, v in fields.items()}
+
+
+async def _ready_counts(UID: str):
+    fields = await client.hgetall(booked_count_key(UID))
+    return fields if fields.get(READY_FIELD) else None
+
+
+async def rebuild_booked_counts(UID: str):
+    """build_booked_counts once for all concurrent misses, across workers"""
+    return await single_flight(booked_count_key(UID), lambda: build_booked_counts(UID), check=lambda: _ready_counts(UID))
+
+
+def revalidate_booked_counts(UID: str, fields: dict):
+    """Schedule a background rebuild when the cached hash is past its soft expiry"""
+    try:
+        soft_expires = float(fields.get(SOFT_EXPIRES_FIELD, 0))
+    except ValueError:
+        soft_expires = 0
+    if soft_expires <= time.time():
+        refresh_in_background(booked_count_key(UID), lambda: build_booked_counts(UID))
+
+
+def busy_dates_from_counts(schedule: CompiledSchedule, fields: dict):
+    """Compare each day's booked count with that day's slots in the compiled schedule, no database access"""
+    today = datetime.now().date()
+    end_date = today + timedelta(days=BUSY_WINDOW_DAYS)
+    today_str = today.strftime("%d-%m-%Y")
+    end_date_str = end_date.strftime("%d-%m-%Y")
+    date_range = {"from": today_str, "to": end_date_str}
+
+    UID = schedule.UID
+    max_slots_per_day = schedule.max_slots_per_day
+    working_days = schedule.working_days
+    holidays = schedule.holiday_days + sorted(schedule.holiday_dates)
+    message = None
+    if not schedule.configured:
+        message = "No working time configured"
+    elif max_slots_per_day == 0:
+        message = "No available meeting slots configured, error in user schedule"
+    if message:
+        return {
+            "UID": UID,
+            "busy_dates": [],
+            "max_slots_per_day": max_slots_per_day,
+            "total_busy_dates": 0,
+            "working_days": working_days,
+            "date_range": date_range,
+            "message": message
+        }
+
+    meetings_by_date = {}
+    busy = []
+    for date, count in fields.items():
+        if date.startswith("_"):
+            continue
+        count = int(count)
+        try:
+            day = datetime.strptime(date, "%d-%m-%Y").date()
+        except ValueError:
+            continue
+        if count <= 0 or not today <= day <= end_date:
+            continue
+        meetings_by_date[date] = count
+
+        # holidays and non-working days have no slots and are never busy
+        slots = len(schedule.slots_for(date))
+        if slots and count >= slots:
+            busy.append((day, date, day.strftime("%A").lower()))
+
+    busy.sort()
+    return {
+        "UID": UID,
+        "busy_dates": [date for _, date, _ in busy],
+        "busy_days_name": [day_name for _, _, day_name in busy],
+        "max_slots_per_day": max_slots_per_day,
+        "slots_per_day": {day: len(slots) for day, slots in schedule.slots_by_day.items()},
+        "total_busy_dates": len(busy),
+        "working_days": working_days,
+        "total_holidays": len(holidays),
+        "holidays": holidays,
+        "date_range": date_range,
+        "meetings_by_date": meetings_by_date
+    }
@@ -0,0 +1,17 @@
+import os
+import random
+from ..config.redis_config import client
+
+# Shared Redis plumbing for the caches: pipelines and TTL jitter.
+
+TTL_JITTER = float(os.getenv("TTL_JITTER", 0.1))  # keys live between (1 - TTL_JITTER) and 1 times their TTL
+
+
+def jittered(ttl: int):
+    """Randomly shorten a TTL so keys written together don't all expire together"""
+    return max(1, int(ttl * random.uniform(1 - TTL_JITTER, 1)))
+
+
+def pipeline(transaction: bool = True):
+    """MULTI/EXEC pipeline by default, pass transaction=False for plain batching of reads"""
+    return client.pipeline(transaction=transaction)
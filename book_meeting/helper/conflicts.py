@@ -0,0 +1,180 @@
+import logging
+from bisect import bisect_left
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+from ..config.database import conn
+from ..config.redis_config import client
+from .cache import jittered, pipeline
+from .events import on, BOOKED, CANCELLED, ARCHIVED
+from .migrations import starts_between
+from .single_flight import single_flight
+
+logger = logging.getLogger("meeting_log")
+
+# Booked start times per (UID, date) kept as a Redis sorted set scored by minute of day,
+# a conflict check is a single ZRANGEBYSCORE around the candidate time.
+
+SLOT_INDEX_TTL = 8 * 24 * 60 * 60
+READY = "__ready__"  # sentinel scored -inf so an empty day still counts as loaded
+UNKNOWN_TIME = float("inf")  # score of a stored meeting whose time can't be parsed, it blocks the whole day
+
+# Check and claim a start time in one atomic step, only requests for the same (UID, date)
+# ever contend. Returns -1 when the set is not loaded so the caller can warm it and retry.
+RESERVE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+if redis.call('ZCOUNT', KEYS[1], '+inf', '+inf') > 0 then
+    return 0
+end
+local start = tonumber(ARGV[2])
+local duration = tonumber(ARGV[3])
+local clashes = redis.call('ZRANGEBYSCORE', KEYS[1], '(' .. (start - duration), '(' .. (start + duration))
+for _, member in ipairs(clashes) do
+    if member ~= ARGV[1] then
+        return 0
+    end
+end
+redis.call('ZADD', KEYS[1], start, ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+reserve_script = client.register_script(RESERVE_SCRIPT)
+
+# Record a booking only in a loaded set, a set created here would lack the READY sentinel and
+# the day's other bookings
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+redis.call('ZADD', KEYS[1], ARGV[2], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+"""
+add_script = client.register_script(ADD_SCRIPT)
+
+
+def slot_index_key(UID: str, date: str):
+    return f"booked_slots:{UID}:{date}"
+
+
+def to_minutes(time_str: str):
+    """'HH:MM' -> minutes since midnight"""
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def meeting_minutes(meeting: dict):
+    """Start minute of a stored meeting, None when its time can't be parsed"""
+    try:
+        return to_minutes(meeting["meeting_time"])
+    except (KeyError, AttributeError, ValueError):
+        logger.warning(f"Unparseable time {meeting.get('meeting_time')!r} on meeting {meeting.get('meeting_id')}, its day counts as booked")
+        return None
+
+
+def has_conflict(starts: List[int], start: int, duration: int):
+    """Bisect lookup in a sorted list of start minutes, two meetings clash when they start less than duration apart"""
+    i = bisect_left(starts, start - duration + 1)
+    return i < len(starts) and starts[i] < start + duration
+
+
+async def _slot_index_loaded(key: str):
+    return await client.exists(key) or None
+
+
+async def warm_slot_index(UID: str, date: str):
+    """Load the day's bookings from Mongo once, later checks never touch the database"""
+    key = slot_index_key(UID, date)
+    if await client.exists(key):
+        return
+    await single_flight(key, lambda: _load_slot_index(UID, date), check=lambda: _slot_index_loaded(key))
+
+
+async def _load_slot_index(UID: str, date: str):
+    key = slot_index_key(UID, date)
+    day_start = datetime.strptime(date, "%d-%m-%Y")
+    meetings = await conn.booking.meeting.find(
+        {"UID": UID, **starts_between(day_start, day_start + timedelta(days=1))},
+        {"meeting_id": 1, "meeting_time": 1}
+    ).to_list(length=None)
+    mapping = {READY: float("-inf")}
+    for meeting in meetings:
+        minute = meeting_minutes(meeting)
+        mapping[meeting["meeting_id"]] = UNKNOWN_TIME if minute is None else minute
+    pipe = pipeline()
+    pipe.zadd(key, mapping)
+    pipe.expire(key, jittered(SLOT_INDEX_TTL))
+    await pipe.execute()
+    return True
+
+
+async def reserve_slot(UID: str, date: str, meeting_id: str, time: str, duration: int):
+    """Atomically claim time for meeting_id, False if another meeting starts less than duration away.
+
+    Reserving an id that is already in the set moves it, which is how same day reschedules work.
+    """
+    key = slot_index_key(UID, date)
+    for _ in range(3):
+        await warm_slot_index(UID, date)
+        result = await reserve_script(keys=[key], args=[meeting_id, to_minutes(time), duration, jittered(SLOT_INDEX_TTL)])
+        if result != -1:
+            return result == 1
+    raise RuntimeError(f"Could not load booked slots for {UID} on {date}")
+
+
+async def add_booking(UID: str, date: str, meeting_id: str, time: str):
+    await warm_slot_index(UID, date)
+    pipe = pipeline()
+    pipe.zadd(slot_index_key(UID, date), {meeting_id: to_minutes(time)})
+    pipe.expire(slot_index_key(UID, date), jittered(SLOT_INDEX_TTL))
+    await pipe.execute()
+
+
+async def remove_booking(UID: str, date: str, meeting_id: str):
+    await client.zrem(slot_index_key(UID, date), meeting_id)
+
+
+@on(BOOKED, priority=30)
+async def _index_booking(pipe, meeting: dict):
+    minute = meeting_minutes(meeting)
+    await add_script(keys=[slot_index_key(meeting["UID"], meeting["meeting_date"])],
+                     args=[meeting["meeting_id"], UNKNOWN_TIME if minute is None else minute, jittered(SLOT_INDEX_TTL)], client=pipe)
+
+
+@on(CANCELLED, ARCHIVED, priority=30)
+async def _unindex_booking(pipe, meeting: dict):
+    pipe.zrem(slot_index_key(meeting["UID"], meeting["meeting_date"]), meeting["meeting_id"])
+
+
+async def reserve_slots(entries: List[Tuple[str, str, str, str, int]], booked: Dict[Tuple[str, str], Dict[str, int]]):
+    """Claim many (UID, date, meeting_id, time, duration) at once, True per entry that got its slot.
+
+    booked holds the bookings already read from Mongo per (UID, date), it seeds the sets that
+    aren't loaded yet so no extra database read is needed.
+    """
+    days = list(dict.fromkeys((UID, date) for UID, date, _, _, _ in entries))
+    pipe = pipeline(transaction=False)
+    for UID, date in days:
+        pipe.exists(slot_index_key(UID, date))
+    loaded = await pipe.execute()
+
+    pipe = pipeline(transaction=False)
+    for (UID, date), exists in zip(days, loaded):
+        if not exists:
+            pipe.zadd(slot_index_key(UID, date), {READY: float("-inf"), **booked.get((UID, date), {})})
+            pipe.expire(slot_index_key(UID, date), jittered(SLOT_INDEX_TTL))
+    for UID, date, meeting_id, time, duration in entries:
+        await reserve_script(keys=[slot_index_key(UID, date)], args=[meeting_id, to_minutes(time), duration, jittered(SLOT_INDEX_TTL)], client=pipe)
+    results = await pipe.execute()
+    return [result == 1 for result in results[len(results) - len(entries):]]
+
+
+async def remove_bookings(entries: List[Tuple[str, str, str]]):
+    """Drop many (UID, date, meeting_id) reservations in one round trip"""
+    if not entries:
+        return
+    pipe = pipeline(transaction=False)
+    for UID, date, meeting_id in entries:
+        pipe.zrem(slot_index_key(UID, date), meeting_id)
+    await pipe.execute()
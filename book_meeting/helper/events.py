@@ -0,0 +1,45 @@
+from collections import defaultdict
+from typing import Tuple
+from .cache import pipeline
+
+# Meeting write events. Every module that keeps a cache derived from booking.meeting registers a
+# handler that queues its invalidation or patch on the pipeline of the write, so one mutation
+# updates every cache in a single MULTI. Handlers run in ascending priority.
+
+BOOKED = "booked"
+CANCELLED = "cancelled"
+ARCHIVED = "archived"
+
+_handlers = defaultdict(list)  # event -> [(priority, handler)]
+
+
+def on(*events: str, priority: int = 50):
+    """Register an async handler(pipe, meeting) for one or more events"""
+    def register(handler):
+        for event in events:
+            _handlers[event].append((priority, handler))
+            _handlers[event].sort(key=lambda entry: entry[0])
+        return handler
+    return register
+
+
+async def queue_event(pipe, event: str, meeting: dict):
+    for _, handler in _handlers[event]:
+        await handler(pipe, meeting)
+
+
+async def prepare(*events: Tuple[str, dict]):
+    """Queue (event, meeting) pairs on a new MULTI without running it.
+
+    Build it before the Mongo write so a handler that fails does so while nothing has changed yet.
+    """
+    pipe = pipeline()
+    for event, meeting in events:
+        await queue_event(pipe, event, meeting)
+    return pipe
+
+
+async def publish(*events: Tuple[str, dict]):
+    """Apply (event, meeting) pairs in order in one MULTI, e.g. publish((CANCELLED, old), (BOOKED, new))"""
+    pipe = await prepare(*events)
+    await pipe.execute()
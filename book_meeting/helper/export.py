@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+from .listing import COLLECTIONS
+from .migrations import starts_between
+
+logger = logging.getLogger("meeting_log")
+
+# Meeting exports are streamed straight off the Motor cursor, one batch_size sized chunk of rows
+# at a time, so the server holds a single batch in memory whatever the size of the history.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_FIELDS = ["meeting_id", "UID", "full_name", "email", "meeting_date", "meeting_time", "status", "number_of_meetings"]
+EXPORT_PROJECTION = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS}}
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _in_range(date: str, start: Optional[datetime], end: Optional[datetime]):
+    try:
+        day = datetime.strptime(date, "%d-%m-%Y")
+    except (TypeError, ValueError):
+        return False
+    return (start is None or day >= start) and (end is None or day < end)
+
+
+async def export_query(kind: str, UID: Optional[str], email: Optional[str], start: Optional[datetime], end: Optional[datetime]):
+    """Filter served by the uid_starts_at or email_starts_at_meeting_id index, end is exclusive.
+
+    Meetings without starts_at are matched by meeting_date like every other range read. With only
+    one bound their dates can't be listed up front, so the few distinct dates they have are read first.
+    """
+    query = {}
+    if UID:
+        query["UID"] = UID
+    if email:
+        query["email"] = email
+    if start and end:
+        query.update(starts_between(start, end))
+    elif start or end:
+        bounds = {"$gte": start} if start else {"$lt": end}
+        legacy = await COLLECTIONS[kind].distinct("meeting_date", {**query, "starts_at": None})
+        dates = [date for date in legacy if _in_range(date, start, end)]
+        query["$or"] = [{"starts_at": bounds}, {"starts_at": None, "meeting_date": {"$in": dates}}]
+    return query
+
+
+def _csv_chunk(rows: list, header: bool = False):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def _ndjson_chunk(rows: list):
+    return "".join(json.dumps(row, default=str) + "\n" for row in rows)
+
+
+async def stream_meetings(kind: str, query: dict, fmt: str):
+    """Yield the export as text chunks of EXPORT_BATCH_SIZE rows, in starts_at order"""
+    cursor = COLLECTIONS[kind].find(query, EXPORT_PROJECTION).sort("starts_at", 1).batch_size(EXPORT_BATCH_SIZE)
+    if fmt == "csv":
+        yield _csv_chunk([], header=True)
+    rows, total = [], 0
+    try:
+        async for meeting in cursor:
+            rows.append(meeting)
+            if len(rows) >= EXPORT_BATCH_SIZE:
+                yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
+                total += len(rows)
+                rows = []
+        if rows:
+            yield _csv_chunk(rows) if fmt == "csv" else _ndjson_chunk(rows)
+            total += len(rows)
+        logger.info(f"Exported {total} meetings from {kind} as {fmt}")
+    except Exception as e:
+        # the status line is already sent, the client sees a truncated body
+        logger.error(f"Meeting export failed after {total} rows: {str(e)}")
+        raise
+    finally:
+        await cursor.close()
@@ -0,0 +1,47 @@
+import asyncio
+import os
+from .cache import pipeline
+
+ID_SEQUENCE_KEY = "meeting_id_seq"
+ID_FLOOR = 1000000  # legacy random ids have 6 digits, leased ids always start above them
+ID_BLOCK_SIZE = int(os.getenv("MEETING_ID_BLOCK_SIZE", 100))
+
+
+class IdAllocator:
+    """Hands out meeting ids from blocks leased with a shared Redis INCRBY.
+
+    Every worker leases its own range, so ids are unique across processes and nodes,
+    allocation is O(1) and only one number per block is kept in memory.
+    """
+
+    def __init__(self, key: str, block_size: int, floor: int):
+        self.key = key
+        self.block_size = block_size
+        self.floor = floor
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _lease(self):
+        pipe = pipeline()
+        pipe.set(self.key, self.floor, nx=True)
+        pipe.incrby(self.key, self.block_size)
+        _, end = await pipe.execute()
+        self._next = end - self.block_size + 1
+        self._end = end + 1
+
+    async def next_id(self):
+        while self._next >= self._end:
+            async with self._lock:
+                if self._next >= self._end:
+                    await self._lease()
+        value = self._next
+        self._next += 1
+        return str(value)
+
+
+meeting_ids = IdAllocator(ID_SEQUENCE_KEY, ID_BLOCK_SIZE, ID_FLOOR)
+
+
+async def next_meeting_id():
+    return await meeting_ids.next_id()
@@ -0,0 +1,92 @@
+import base64
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+from ..config.database import conn
+from ..config.redis_config import client
+from .cache import jittered, pipeline
+from .events import on, BOOKED, CANCELLED, ARCHIVED
+
+logger = logging.getLogger("meeting_log")
+
+# Meeting listings are read a page at a time in (starts_at, meeting_id) order. The cursor is the
+# sort key of the last meeting returned, so every page is one bounded index range scan however long
+# the history is. Pages are cached in one hash per email that every meeting write drops.
+
+PAGE_SIZE = int(os.getenv("LISTING_PAGE_SIZE", 20))
+MAX_PAGE_SIZE = 100
+PAGE_CACHE_TTL = int(os.getenv("LISTING_PAGE_TTL", 300))  # seconds
+LISTING_PROJECTION = {"_id": 0, "full_name": 1, "meeting_date": 1, "meeting_time": 1, "UID": 1,
+                      "status": 1, "meeting_id": 1, "number_of_meetings": 1, "starts_at": 1}
+COLLECTIONS = {"meeting": conn.booking.meeting, "previous": conn.booking.temp_meeting}
+
+
+def page_cache_key(kind: str, email: str):
+    return f"meeting_pages:{kind}:{email}"
+
+
+def encode_cursor(meeting: dict):
+    starts_at = meeting.get("starts_at")
+    position = {"s": starts_at.isoformat() if starts_at else None, "m": meeting["meeting_id"]}
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """(starts_at, meeting_id) of the last meeting of the previous page, ValueError if it was tampered with"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        starts_at = datetime.fromisoformat(position["s"]) if position["s"] else None
+        return starts_at, str(position["m"])
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def after_cursor(starts_at: Optional[datetime], meeting_id: str):
+    """Filter for everything after (starts_at, meeting_id), meetings without starts_at sort first"""
+    if starts_at is None:
+        return {"$or": [{"starts_at": None, "meeting_id": {"$gt": meeting_id}}, {"starts_at": {"$ne": None}}]}
+    return {"$or": [{"starts_at": {"$gt": starts_at}}, {"starts_at": starts_at, "meeting_id": {"$gt": meeting_id}}]}
+
+
+async def fetch_page(kind: str, email: str, limit: int, cursor: Optional[str] = None):
+    query = {"email": email}
+    if cursor:
+        query.update(after_cursor(*decode_cursor(cursor)))
+    # one extra document tells whether there is a next page
+    meetings = await COLLECTIONS[kind].find(query, LISTING_PROJECTION) \
+        .sort([("starts_at", 1), ("meeting_id", 1)]).limit(limit + 1).to_list(length=limit + 1)
+    has_more = len(meetings) > limit
+    meetings = meetings[:limit]
+    next_cursor = encode_cursor(meetings[-1]) if has_more else None
+    for meeting in meetings:
+        meeting.pop("starts_at", None)
+    return {"email": email, "meetings": meetings, "limit": limit, "next_cursor": next_cursor}
+
+
+async def get_page(kind: str, email: str, limit: int = PAGE_SIZE, cursor: Optional[str] = None):
+    """One page of an email's meetings ("meeting") or archived meetings ("previous"), served from cache when possible"""
+    field = f"{limit}:{cursor or ''}"
+    cached = await client.hget(page_cache_key(kind, email), field)
+    if cached:
+        return json.loads(cached)
+
+    page = await fetch_page(kind, email, limit, cursor)
+    pipe = pipeline()
+    pipe.hset(page_cache_key(kind, email), field, json.dumps(page))
+    pipe.expire(page_cache_key(kind, email), jittered(PAGE_CACHE_TTL))
+    await pipe.execute()
+    return page
+
+
+async def drop_pages(email: str, kinds=tuple(COLLECTIONS)):
+    """Delete the cached pages of an email, returns how many page hashes existed"""
+    return await client.delete(*[page_cache_key(kind, email) for kind in kinds])
+
+
+@on(BOOKED, CANCELLED, ARCHIVED, priority=10)
+async def _drop_cached_pages(pipe, meeting: dict):
+    if meeting.get("email"):
+        for kind in COLLECTIONS:
+            pipe.delete(page_cache_key(kind, meeting["email"]))
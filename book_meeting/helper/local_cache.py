@@ -0,0 +1,130 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional
+from ..config.redis_config import client
+
+logger = logging.getLogger("meeting_log")
+
+# Bounded TTL + LRU caches held in each worker's memory. A key invalidated in one worker is
+# broadcast over Redis pub/sub so every other worker drops it too.
+
+INVALIDATION_CHANNEL = "local_cache_invalidation"
+WORKER_ID = uuid.uuid4().hex
+MISSING = object()
+
+_caches = {}  # name -> LocalCache
+_listener: Optional[asyncio.Task] = None
+
+
+class LocalCache:
+    """OrderedDict of key -> (expires_at, value), least recently used entries go first when full"""
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        _caches[name] = self
+
+    def get(self, key, default=MISSING):
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return default
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return default
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: Optional[float] = None):
+        self._entries[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        if self._entries.pop(key, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations
+        }
+
+
+def cache_stats():
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+async def invalidate(name: str, key: str):
+    """Drop key from the named cache here and in every other worker"""
+    _caches[name].invalidate(key)
+    await client.publish(INVALIDATION_CHANNEL, json.dumps({"cache": name, "key": key, "origin": WORKER_ID}))
+
+
+async def _listen():
+    while True:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # anything published while we weren't subscribed is lost, start from empty caches
+            for cache in _caches.values():
+                cache.clear()
+            while True:
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not message:
+                    continue
+                data = json.loads(message["data"])
+                if data.get("origin") != WORKER_ID and data.get("cache") in _caches:
+                    _caches[data["cache"]].invalidate(data["key"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Cache invalidation listener failed, resubscribing: {str(e)}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.close()
+
+
+def start_invalidation_listener():
+    global _listener
+    if _listener is None:
+        _listener = asyncio.create_task(_listen())
+
+
+async def stop_invalidation_listener():
+    global _listener
+    if _listener is None:
+        return
+    _listener.cancel()
+    try:
+        await _listener
+    except asyncio.CancelledError:
+        pass
+    _listener = None
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import os
+import random
+import httpx
+
+logger = logging.getLogger("meeting_log")
+
+LOG_SERVICE_URL = os.getenv("LOG_SERVICE_URL", "http://127.0.0.1:8000/backend/create_new_logs")
+
+
+class LogShipper:
+    """Bounded in-process queue that ships log records to the logging service in the background.
+
+    Handlers never wait on the logging service: records are queued with put_nowait,
+    info records are sampled once the queue passes the high watermark and anything
+    that doesn't fit is dropped and counted.
+    """
+
+    def __init__(self, url: str, max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 1.0,
+                 high_watermark: float = 0.8, sample_rate: float = 0.1, max_connections: int = 10):
+        self.url = url
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.high_watermark = high_watermark
+        self.sample_rate = sample_rate
+        self.max_connections = max_connections
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._client = None
+        self._task = None
+        self.counters = {"submitted": 0, "shipped": 0, "failed": 0, "dropped": 0, "sampled_out": 0}
+
+    def submit(self, record: dict, headers: dict):
+        """Queue a record without blocking, returns False if it was shed"""
+        if self._queue.qsize() >= self.max_queue * self.high_watermark and record.get("log_type") != "error":
+            if random.random() >= self.sample_rate:
+                self.counters["sampled_out"] += 1
+                return False
+        try:
+            self._queue.put_nowait((record, headers))
+        except asyncio.QueueFull:
+            self.counters["dropped"] += 1
+            return False
+        self.counters["submitted"] += 1
+        return True
+
+    def stats(self):
+        return {**self.counters, "queued": self._queue.qsize(), "max_queue": self.max_queue}
+
+    def start(self):
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        self._client = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(5.0))
+        self._task = asyncio.create_task(self._run())
+        logger.info("Log shipper started")
+
+    async def stop(self, timeout: float = 5.0):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # best effort flush of whatever is still queued
+        remaining = []
+        while not self._queue.empty():
+            remaining.append(self._queue.get_nowait())
+        if remaining and self._client:
+            try:
+                await asyncio.wait_for(self._ship(remaining), timeout=timeout)
+            except asyncio.TimeoutError:
+                self.counters["dropped"] += len(remaining)
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+        logger.info(f"Log shipper stopped: {self.stats()}")
+
+    async def _next_batch(self):
+        """Wait for one record, then collect more until the batch is full or the flush interval passes"""
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _post(self, record: dict, headers: dict):
+        resp = await self._client.post(self.url, json=record, headers=headers)
+        resp.raise_for_status()
+
+    async def _ship(self, batch: list):
+        results = await asyncio.gather(*(self._post(record, headers) for record, headers in batch), return_exceptions=True)
+        failed = sum(1 for result in results if isinstance(result, Exception))
+        self.counters["shipped"] += len(batch) - failed
+        self.counters["failed"] += failed
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._ship(batch)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.counters["failed"] += len(batch)
+                logger.warning(f"Log shipper failed to ship {len(batch)} records: {str(e)}")
+
+
+log_shipper = LogShipper(
+    LOG_SERVICE_URL,
+    max_queue=int(os.getenv("LOG_SHIPPER_MAX_QUEUE", 10000)),
+    batch_size=int(os.getenv("LOG_SHIPPER_BATCH_SIZE", 100)),
+    flush_interval=float(os.getenv("LOG_SHIPPER_FLUSH_INTERVAL", 1.0))
+)
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from ..config.database import conn
+
+logger = logging.getLogger("meeting_log")
+
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", 500))
+MIGRATION_PAUSE = float(os.getenv("MIGRATION_PAUSE", 0.1))  # seconds between batches, keeps the primary responsive
+
+
+def meeting_starts_at(meeting_date: str, meeting_time: str):
+    """Canonical start of a meeting from its 'DD-MM-YYYY' date and 'HH:MM' time strings"""
+    return datetime.strptime(f"{meeting_date} {meeting_time}", "%d-%m-%Y %H:%M")
+
+
+def dates_between(start: datetime, end: datetime):
+    """'DD-MM-YYYY' of every day in [start, end)"""
+    day, dates = start.replace(hour=0, minute=0, second=0, microsecond=0), []
+    while day < end:
+        dates.append(day.strftime("%d-%m-%Y"))
+        day += timedelta(days=1)
+    return dates
+
+
+def starts_between(start: datetime, end: datetime):
+    """starts_at range filter that also matches meetings of those days without a starts_at.
+
+    Those are documents the backfill hasn't reached yet and ones it couldn't parse, leaving
+    them out would let their slots be booked again.
+    """
+    return {"$or": [
+        {"starts_at": {"$gte": start, "$lt": end}},
+        {"starts_at": None, "meeting_date": {"$in": dates_between(start, end)}}
+    ]}
+
+
+async def backfill_starts_at(collection, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Add starts_at to documents written before the field existed, one batch at a time.
+
+    Batches walk the _id index forward so each one starts where the last stopped.
+    Documents whose date or time can't be parsed get starts_at=None, range reads still
+    find them by meeting_date through starts_between.
+    """
+    migrated = 0
+    last_id = None
+    while True:
+        query = {"starts_at": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        documents = await collection.find(
+            query,
+            {"meeting_date": 1, "meeting_time": 1}
+        ).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not documents:
+            break
+        last_id = documents[-1]["_id"]
+
+        updates = []
+        for document in documents:
+            try:
+                starts_at = meeting_starts_at(document["meeting_date"], document["meeting_time"])
+            except (KeyError, TypeError, ValueError):
+                logger.warning(f"Unparseable meeting date in {collection.name}: {document['_id']}")
+                starts_at = None
+            updates.append(UpdateOne({"_id": document["_id"]}, {"$set": {"starts_at": starts_at}}))
+        await collection.bulk_write(updates, ordered=False)
+        migrated += len(updates)
+        await asyncio.sleep(MIGRATION_PAUSE)
+
+    logger.info(f"Backfilled starts_at on {migrated} documents in {collection.name}")
+    return migrated
+
+
+async def run_migrations():
+    try:
+        await backfill_starts_at(conn.booking.meeting)
+        await backfill_starts_at(conn.booking.temp_meeting)
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Migration failed: {str(e)}")
@@ -0,0 +1,177 @@
+import asyncio
+import os
+import random
+import smtplib
+import traceback
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from typing import List, Optional, Tuple
+from pymongo import ReturnDocument
+from ..config.database import conn
+from .utils import setup_logging, NO_REPLY_EMAIL
+
+logger = setup_logging()
+
+# persistent outbox, shared by every worker process
+outbox = conn.booking.email_outbox
+
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 4))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))
+OUTBOX_BASE_BACKOFF = int(os.getenv("OUTBOX_BASE_BACKOFF", 5))  # seconds
+OUTBOX_MAX_BACKOFF = int(os.getenv("OUTBOX_MAX_BACKOFF", 300))  # seconds
+OUTBOX_POLL_INTERVAL = int(os.getenv("OUTBOX_POLL_INTERVAL", 2))  # seconds
+OUTBOX_LEASE = int(os.getenv("OUTBOX_LEASE", 60))  # seconds a claimed message stays locked
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 1025))
+SMTP_TIMEOUT = int(os.getenv("SMTP_TIMEOUT", 10))
+
+_wakeup = asyncio.Event()
+_workers = []
+
+
+def _outbox_message(to_email: str, subject: str, body: str, meeting_id: Optional[str] = None):
+    now = datetime.utcnow()
+    return {
+        "to_email": to_email,
+        "subject": subject,
+        "body": body,
+        "meeting_id": meeting_id,
+        "status": "pending",
+        "attempts": 0,
+        "last_error": None,
+        "next_attempt_at": now,
+        "lease_expires_at": None,
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+async def enqueue_email(to_email: str, subject: str, body: str, meeting_id: Optional[str] = None):
+    """Store an email in the outbox and return its id, delivery happens in the background"""
+    result = await outbox.insert_one(_outbox_message(to_email, subject, body, meeting_id))
+    _wakeup.set()
+    logger.info(f"Email to {to_email} queued in outbox: {result.inserted_id}")
+    return str(result.inserted_id)
+
+
+async def enqueue_emails(messages: List[Tuple[str, str, str, Optional[str]]]):
+    """Store many (to_email, subject, body, meeting_id) emails with one insert_many"""
+    if not messages:
+        return []
+    result = await outbox.insert_many([_outbox_message(*message) for message in messages], ordered=False)
+    _wakeup.set()
+    logger.info(f"{len(result.inserted_ids)} emails queued in outbox")
+    return [str(inserted_id) for inserted_id in result.inserted_ids]
+
+
+async def get_outbox_status(meeting_id: str):
+    """Return the delivery status of every outbox message sent for a meeting"""
+    messages = await outbox.find(
+        {"meeting_id": meeting_id},
+        {"body": 0}
+    ).sort("created_at", 1).to_list(length=None)
+    for message in messages:
+        message["_id"] = str(message["_id"])
+    return messages
+
+
+def _smtp_send(to_email: str, subject: str, body: str):
+    """Single blocking delivery attempt to the SMTP server, runs in a worker thread"""
+    msg = MIMEText(body, "html")
+    msg["Subject"] = subject
+    msg["From"] = NO_REPLY_EMAIL
+    msg["To"] = to_email
+
+    with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as server:
+        server.sendmail(NO_REPLY_EMAIL, [to_email], msg.as_string())
+
+
+def _backoff(attempts: int):
+    delay = min(OUTBOX_MAX_BACKOFF, OUTBOX_BASE_BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.5)  # jitter so retries don't line up
+
+
+async def _claim_next():
+    """Atomically lock the next due message, including ones whose lease expired after a crash"""
+    now = datetime.utcnow()
+    return await outbox.find_one_and_update(
+        {"$or": [
+            {"status": "pending", "next_attempt_at": {"$lte": now}},
+            {"status": "sending", "lease_expires_at": {"$lte": now}}
+        ]},
+        {
+            "$set": {
+                "status": "sending",
+                "lease_expires_at": now + timedelta(seconds=OUTBOX_LEASE),
+                "updated_at": now
+            },
+            "$inc": {"attempts": 1}
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+async def _deliver(message: dict):
+    try:
+        await asyncio.to_thread(_smtp_send, message["to_email"], message["subject"], message["body"])
+    except Exception as e:
+        now = datetime.utcnow()
+        if message["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "dead", "last_error": str(e), "lease_expires_at": None, "updated_at": now}
+            logger.error(f"Email {message['_id']} dead-lettered after {message['attempts']} attempts: {traceback.format_exc()}")
+        else:
+            update = {
+                "status": "pending",
+                "last_error": str(e),
+                "lease_expires_at": None,
+                "next_attempt_at": now + timedelta(seconds=_backoff(message["attempts"])),
+                "updated_at": now
+            }
+            logger.warning(f"Email {message['_id']} failed (attempt {message['attempts']}): {str(e)}")
+        await outbox.update_one({"_id": message["_id"]}, {"$set": update})
+        return
+
+    now = datetime.utcnow()
+    await outbox.update_one({"_id": message["_id"]}, {"$set": {
+        "status": "sent",
+        "last_error": None,
+        "lease_expires_at": None,
+        "sent_at": now,
+        "updated_at": now
+    }})
+    logger.info(f"Email {message['_id']} sent to {message['to_email']}")
+
+
+async def _worker(number: int):
+    while True:
+        try:
+            message = await _claim_next()
+            if not message:
+                _wakeup.clear()
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=OUTBOX_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await _deliver(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Outbox worker {number} error: {str(e)}")
+            await asyncio.sleep(OUTBOX_POLL_INTERVAL)
+
+
+def start_outbox_workers(count: int = OUTBOX_WORKERS):
+    """Start the background worker pool that drains the outbox"""
+    for number in range(count):
+        _workers.append(asyncio.create_task(_worker(number)))
+    logger.info(f"Started {count} outbox workers")
+
+
+async def stop_outbox_workers():
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    logger.info("Outbox workers stopped")
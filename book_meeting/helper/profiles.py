@@ -0,0 +1,56 @@
+import os
+from typing import List, Optional
+from ..config.database import conn
+from .local_cache import LocalCache, MISSING, invalidate
+
+# Profile and auth lookups served from worker memory, documents are trimmed to the fields
+# the booking service reads.
+
+PROFILE_PROJECTION = {"_id": 0, "UID": 1, "avg_meeting_duration": 1, "working_time": 1, "work_address": 1}
+AUTH_PROJECTION = {"_id": 0, "UID": 1, "full_name": 1, "email": 1}
+PROFILE_CACHE_SIZE = int(os.getenv("PROFILE_CACHE_SIZE", 10000))
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", 300))  # seconds
+
+profile_cache = LocalCache("profile", PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+auth_cache = LocalCache("auth_user", PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
+
+
+async def get_profile(UID: str) -> Optional[dict]:
+    profile = profile_cache.get(UID)
+    if profile is not MISSING:
+        return profile
+    profile = await conn.public_profile_data.user.find_one({"UID": UID}, PROFILE_PROJECTION)
+    if profile:
+        profile_cache.set(UID, profile)
+    return profile
+
+
+async def get_auth_users(UID: str) -> List[dict]:
+    """Every auth account with this UID"""
+    key = f"uid:{UID}"
+    users = auth_cache.get(key)
+    if users is not MISSING:
+        return users
+    users = await conn.auth.user.find({"UID": UID}, AUTH_PROJECTION).to_list(length=None)
+    if users:
+        auth_cache.set(key, users)
+    return users
+
+
+async def get_auth_user_by_email(email: str) -> Optional[dict]:
+    key = f"email:{email}"
+    user = auth_cache.get(key)
+    if user is not MISSING:
+        return user
+    user = await conn.auth.user.find_one({"email": email}, AUTH_PROJECTION)
+    if user:
+        auth_cache.set(key, user)
+    return user
+
+
+async def invalidate_user(UID: str, email: Optional[str] = None):
+    """Drop a user's cached profile and auth documents in every worker"""
+    await invalidate("profile", UID)
+    await invalidate("auth_user", f"uid:{UID}")
+    if email:
+        await invalidate("auth_user", f"email:{email}")
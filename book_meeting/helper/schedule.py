@@ -0,0 +1,246 @@
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+from ..config.database import conn
+from ..config.redis_config import client
+from .cache import jittered
+from .conflicts import to_minutes
+from .local_cache import LocalCache, MISSING, invalidate
+from .profiles import PROFILE_PROJECTION, get_profile, profile_cache
+from .single_flight import single_flight
+
+logger = logging.getLogger("meeting_log")
+
+# A user's weekly schedule compiled once per profile version and shared by the slot and
+# busy date engines. Kept in each worker's LocalCache and in Redis at schedule:{UID}.
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+SCHEDULE_TTL = 8 * 24 * 60 * 60
+SCHEDULE_LOCAL_TTL = int(os.getenv("SCHEDULE_LOCAL_TTL", 60))
+SCHEDULE_LOCAL_SIZE = int(os.getenv("SCHEDULE_LOCAL_SIZE", 10000))
+
+local_schedules = LocalCache("schedule", SCHEDULE_LOCAL_SIZE, SCHEDULE_LOCAL_TTL)
+
+
+def schedule_key(UID: str):
+    return f"schedule:{UID}"
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _extend_array(arr: list, target_len: int):
+    arr = list(arr)
+    if len(arr) < target_len and len(arr) > 0:
+        arr.extend([arr[-1]] * (target_len - len(arr)))
+    return arr
+
+
+def compile_entry(working_time: dict, avg_meeting_duration: int):
+    """One working_time entry -> working hours and its slot grid in minutes since midnight"""
+    start_times = _as_list(working_time.get('start_time'))
+    end_times = _as_list(working_time.get('end_time'))
+    start_break_times = _as_list(working_time.get('start_break_time'))
+    end_break_times = _as_list(working_time.get('end_break_time'))
+
+    # Ensure all arrays have the same length by extending shorter ones with their last value
+    max_len = max(len(start_times), len(end_times), len(start_break_times), len(end_break_times))
+    start_times = _extend_array(start_times, max_len)
+    end_times = _extend_array(end_times, max_len)
+    start_break_times = _extend_array(start_break_times, max_len)
+    end_break_times = _extend_array(end_break_times, max_len)
+
+    slots = set()
+    working_hours = []
+    for i in range(min(len(start_times), len(end_times))):
+        start_break = start_break_times[i] if i < len(start_break_times) else None
+        end_break = end_break_times[i] if i < len(end_break_times) else None
+        working_hours.append({
+            "start_time": start_times[i],
+            "end_time": end_times[i],
+            "break_time": {"start": start_break, "end": end_break}
+        })
+        try:
+            start, end = to_minutes(start_times[i]), to_minutes(end_times[i])
+            periods = [(start, end)]
+            if start_break and end_break:
+                periods = [(start, to_minutes(start_break)), (to_minutes(end_break), end)]
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Error processing time slot {i}: {str(e)}")
+            continue
+        for period_start, period_end in periods:
+            slots.update(range(period_start, period_end - avg_meeting_duration + 1, avg_meeting_duration))
+    return working_hours, slots
+
+
+class CompiledSchedule:
+    """Per weekday slot offsets, holidays and slots per day for one version of a user's profile"""
+
+    def __init__(self, UID: str, version: str, avg_meeting_duration: int, slots_by_day: Dict[str, List[int]],
+                 working_days: List[str], holiday_days: List[str], holiday_dates: List[str],
+                 working_hours: list, working_address, configured: bool = True):
+        self.UID = UID
+        self.version = version
+        self.avg_meeting_duration = avg_meeting_duration
+        self.slots_by_day = slots_by_day
+        self.working_days = working_days
+        self.holiday_days = holiday_days
+        self.holiday_dates = set(holiday_dates)
+        self.working_hours = working_hours
+        self.working_address = working_address
+        self.configured = configured
+
+    @classmethod
+    def compile(cls, UID: str, user: dict):
+        avg_meeting_duration = int(user['avg_meeting_duration'])  # in minutes
+        working_time = user.get('working_time') or []
+        slots_by_day = {day: set() for day in WEEKDAYS}
+        working_days, holiday_days, holiday_dates, working_hours = [], [], [], []
+
+        for entry in working_time:
+            days = [day.lower().strip() for day in _as_list(entry.get('working_days')) if day]
+            for holiday in _as_list(entry.get('holidays')):
+                holiday = str(holiday).strip()
+                if holiday.lower() in WEEKDAYS:
+                    holiday_days.append(holiday.lower())
+                else:
+                    holiday_dates.append(holiday)
+            entry_hours, entry_slots = compile_entry(entry, avg_meeting_duration)
+            working_hours.extend(entry_hours)
+            working_days.extend(day for day in days if day not in working_days)
+            # an entry without working days applies to every day
+            for day in days or WEEKDAYS:
+                if day in slots_by_day:
+                    slots_by_day[day].update(entry_slots)
+
+        for day in holiday_days:
+            slots_by_day[day] = set()
+        if working_days:
+            for day in WEEKDAYS:
+                if day not in working_days:
+                    slots_by_day[day] = set()
+
+        return cls(
+            UID=UID,
+            version=profile_version(user),
+            avg_meeting_duration=avg_meeting_duration,
+            slots_by_day={day: sorted(slots) for day, slots in slots_by_day.items()},
+            working_days=working_days,
+            holiday_days=sorted(set(holiday_days)),
+            holiday_dates=holiday_dates,
+            working_hours=working_hours,
+            working_address=user.get('work_address', []),
+            configured=bool(working_time)
+        )
+
+    def to_json(self):
+        return json.dumps({
+            "UID": self.UID,
+            "version": self.version,
+            "avg_meeting_duration": self.avg_meeting_duration,
+            "slots_by_day": self.slots_by_day,
+            "working_days": self.working_days,
+            "holiday_days": self.holiday_days,
+            "holiday_dates": sorted(self.holiday_dates),
+            "working_hours": self.working_hours,
+            "working_address": self.working_address,
+            "configured": self.configured
+        }, default=str)
+
+    @classmethod
+    def from_json(cls, raw):
+        return cls(**json.loads(raw))
+
+    def slots_for(self, date: str):
+        """Slot grid of a 'DD-MM-YYYY' date, empty on holidays and days off"""
+        if date in self.holiday_dates:
+            return []
+        return self.slots_by_day[datetime.strptime(date, "%d-%m-%Y").strftime("%A").lower()]
+
+    @property
+    def max_slots_per_day(self):
+        return max((len(slots) for slots in self.slots_by_day.values()), default=0)
+
+    def closed_message(self, date: str):
+        day_name = datetime.strptime(date, "%d-%m-%Y").strftime("%A").lower()
+        if date in self.holiday_dates or day_name in self.holiday_days:
+            return f"User is not available on {day_name.capitalize()}s as it's marked as a holiday"
+        if self.working_days and day_name not in self.working_days:
+            return f"User is not available on {day_name.capitalize()}s. Working days are: {', '.join(d.capitalize() for d in self.working_days)}"
+        return None
+
+
+def profile_version(user: dict):
+    """Digest of the profile fields the schedule is compiled from"""
+    source = {key: user.get(key) for key in ("avg_meeting_duration", "working_time", "work_address")}
+    return hashlib.sha1(json.dumps(source, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+async def load_schedule(UID: str, user: Optional[dict] = None):
+    """Compile from the profile and store in Redis, None if the user doesn't exist"""
+    if user is None:
+        user = await get_profile(UID)
+    if not user:
+        return None
+    schedule = CompiledSchedule.compile(UID, user)
+    await client.set(schedule_key(UID), schedule.to_json(), ex=jittered(SCHEDULE_TTL))
+    local_schedules.set(UID, schedule)
+    return schedule
+
+
+async def _redis_schedule(UID: str):
+    raw = await client.get(schedule_key(UID))
+    if not raw:
+        return None
+    schedule = CompiledSchedule.from_json(raw)
+    local_schedules.set(UID, schedule)
+    return schedule
+
+
+async def get_schedule(UID: str):
+    schedule = local_schedules.get(UID)
+    if schedule is not MISSING:
+        return schedule
+    schedule = await _redis_schedule(UID)
+    if schedule:
+        return schedule
+    return await single_flight(schedule_key(UID), lambda: load_schedule(UID), check=lambda: _redis_schedule(UID))
+
+
+async def get_schedules(UIDs: List[str]):
+    """Schedules of many users, misses are read with one MGET and one $in query. Unknown users are left out"""
+    schedules = {}
+    for UID in UIDs:
+        schedule = local_schedules.get(UID)
+        if schedule is not MISSING:
+            schedules[UID] = schedule
+    missing = [UID for UID in UIDs if UID not in schedules]
+    if missing:
+        for UID, raw in zip(missing, await client.mget([schedule_key(UID) for UID in missing])):
+            if raw:
+                schedules[UID] = CompiledSchedule.from_json(raw)
+                local_schedules.set(UID, schedules[UID])
+    missing = [UID for UID in missing if UID not in schedules]
+    if missing:
+        users = await conn.public_profile_data.user.find({"UID": {"$in": missing}}, PROFILE_PROJECTION).to_list(length=None)
+        pipe = client.pipeline(transaction=False)
+        for user in users:
+            profile_cache.set(user["UID"], user)
+            schedule = CompiledSchedule.compile(user["UID"], user)
+            schedules[user["UID"]] = schedule
+            local_schedules.set(user["UID"], schedule)
+            pipe.set(schedule_key(user["UID"]), schedule.to_json(), ex=jittered(SCHEDULE_TTL))
+        await pipe.execute()
+    return schedules
+
+
+async def invalidate_schedule(UID: str):
+    """Forget the compiled schedule in every worker, call whenever the user's profile changes"""
+    await client.delete(schedule_key(UID))
+    await invalidate("schedule", UID)
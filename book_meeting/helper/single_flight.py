@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+from ..config.redis_config import client
+
+logger = logging.getLogger("meeting_log")
+
+# Coalesces cache rebuilds: callers in one worker share a future, workers share a short Redis
+# lock and the losers wait for the winner's result to show up in the cache. Entries past their soft
+# expiry are served as they are while refresh_in_background rebuilds them off the request path.
+
+SINGLE_FLIGHT_LOCK_TTL = float(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 10))  # seconds
+SINGLE_FLIGHT_POLL = 0.05  # seconds between cache checks while another worker rebuilds
+
+# Delete the lock only if we still own it, it may have expired and been taken by someone else
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+release_script = client.register_script(RELEASE_SCRIPT)
+
+_inflight: Dict[str, asyncio.Future] = {}
+_refreshing: Dict[str, asyncio.Task] = {}
+
+
+def _lock_key(key: str):
+    return f"lock:{key}"
+
+
+async def _compute_across_workers(key: str, compute: Callable[[], Awaitable], check: Callable[[], Awaitable]):
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + SINGLE_FLIGHT_LOCK_TTL
+    while True:
+        if await client.set(_lock_key(key), token, nx=True, px=int(SINGLE_FLIGHT_LOCK_TTL * 1000)):
+            try:
+                return await compute()
+            finally:
+                await release_script(keys=[_lock_key(key)], args=[token])
+
+        # another worker is rebuilding, wait for its result to land in the cache
+        while time.monotonic() < deadline:
+            await asyncio.sleep(SINGLE_FLIGHT_POLL)
+            result = await check()
+            if result is not None:
+                return result
+            if not await client.exists(_lock_key(key)):
+                break  # it gave up or failed, try to take over
+        else:
+            logger.warning(f"Single flight wait for {key} timed out, computing locally")
+            return await compute()
+
+
+async def single_flight(key: str, compute: Callable[[], Awaitable], check: Optional[Callable[[], Awaitable]] = None):
+    """Run compute once for key no matter how many callers miss at the same time.
+
+    check reads the cached result and returns None while it isn't there, without it only
+    callers in this worker are coalesced.
+    """
+    future = _inflight.get(key)
+    if future is not None:
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())  # never "exception was never retrieved"
+    _inflight[key] = future
+    try:
+        result = await (_compute_across_workers(key, compute, check) if check else compute())
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _refresh(key: str, compute: Callable[[], Awaitable]):
+    token = uuid.uuid4().hex
+    if not await client.set(_lock_key(key), token, nx=True, px=int(SINGLE_FLIGHT_LOCK_TTL * 1000)):
+        return  # another worker is already rebuilding it
+    try:
+        await single_flight(key, compute)
+    except Exception as e:
+        logger.error(f"Background refresh of {key} failed: {str(e)}")
+    finally:
+        await release_script(keys=[_lock_key(key)], args=[token])
+
+
+def refresh_in_background(key: str, compute: Callable[[], Awaitable]):
+    """Rebuild a stale entry without blocking the caller, at most one refresh per key across workers"""
+    if key in _inflight or key in _refreshing:
+        return
+    task = asyncio.create_task(_refresh(key, compute))
+    _refreshing[key] = task
+    task.add_done_callback(lambda done: _refreshing.pop(key, None))
@@ -1,15 +1,13 @@
-import json
-import random
-import smtplib
-import string
 import logging
 import os
-from book_meeting.models.models import CustomJSONEncoder
 from ..config.redis_config import client
+from .ids import next_meeting_id
+from .migrations import meeting_starts_at
+from .events import publish, BOOKED
+from . import availability, busy_dates, conflicts, listing  # register their meeting event handlers
 import traceback
 import base64
 import pickle
-import requests
 import time
 # from .celery_app import celery
 import os
@@ -19,8 +17,10 @@ from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from ..config.database import conn
+from pymongo import ReturnDocument
 from fastapi import HTTPException, status
 from concurrent_log_handler import ConcurrentRotatingFileHandler
+from .log_shipper import log_shipper
 
 load_dotenv()
 
@@ -63,143 +63,113 @@ def setup_logging():
 
 logger = setup_logging()
 
-rand_numbers = set()
-
-def  random_number():
-    digits = string.digits
-    meeting_id = ''.join(random.choice(digits) for i in range(6))
-    if meeting_id not in rand_numbers:
-        rand_numbers.add(meeting_id)
-        return meeting_id
-    else:
-        return random_number()
-
-async def cache_meeting(data: dict):
-    meeting_key = f"meeting:{data['meeting_date']}:{data['UID']}:{data['meeting_id']}"
-    await client.hset(meeting_key, mapping={
-        "full_name": data['full_name'],
-        "meeting_date": data['meeting_date'],
-        "meeting_time": data['meeting_time'],
-        "UID": data['UID'],
-        "status": data['status'],
-        "meeting_id": data['meeting_id']
-    })
-    await client.expire(meeting_key, 8 * 24 * 60 * 60)  # Cache for 7 days
-    print("Meeting cached successfully")
-
-async def get_cached_meetings(data: dict):
-    keys = await client.keys(f"meeting:{data['meeting_date']}:{data['UID']}*")
-    # print(keys) #debugging
-    meetings = []
-    for key in keys:
-        cached_data = await client.hgetall(key)
-        if cached_data:
-            meetings.append(cached_data)
-    if meetings:
-        # print(meetings) #debugging
-        print("Meetings fetched from cache")
-        return meetings
-    return None
-
-async def delete_cached_meeting(data: dict):
-    keys = await client.keys(f"meeting:{data['meeting_date']}:{data['UID']}:{data['meeting_id']}")
-    for key in keys:
-        await client.delete(key)
-    print("Meeting deleted from cache")
-    return 0
+def counter_filter(data: dict):
+    return {
+        "UID": data["UID"],
+        "full_name": data["full_name"],
+        "meeting_date": data["meeting_date"]
+    }
+
+
+async def increment_meeting_counter(data: dict, amount: int = 1):
+    """Bump the per (UID, full_name, date) meeting counter by amount and return the new value"""
+    counter = await conn.booking.meeting_counter.find_one_and_update(
+        counter_filter(data), {"$inc": {"count": amount}}, return_document=ReturnDocument.AFTER)
+    if counter:
+        return counter["count"]
+
+    # first booking for this day since counters exist, seed from the meetings already stored
+    existing = await conn.booking.meeting.count_documents(counter_filter(data))
+    await conn.booking.meeting_counter.update_one(
+        counter_filter(data), {"$setOnInsert": {"count": existing}}, upsert=True)
+    counter = await conn.booking.meeting_counter.find_one_and_update(
+        counter_filter(data), {"$inc": {"count": amount}}, return_document=ReturnDocument.AFTER)
+    return counter["count"]
+
+
+async def decrement_meeting_counter(data: dict, amount: int = 1):
+    await conn.booking.meeting_counter.update_one(
+        {**counter_filter(data), "count": {"$gte": amount}}, {"$inc": {"count": -amount}})
+
 
 async def insert_in_db(form: dict):
-            form["meeting_id"] = random_number() # generate random meeting id
+            form["meeting_id"] = form.get("meeting_id") or await next_meeting_id() # keep a pre-reserved id or allocate one
             form["status"] = "false" # set status to false
+            form["starts_at"] = meeting_starts_at(form["meeting_date"], form["meeting_time"]) # native datetime for range queries
+            form["number_of_meetings"] = await increment_meeting_counter(form) # stamped on the insert, no count scan
+
+            try:
+                new_meeting = await conn.booking.meeting.insert_one(form)
+            except Exception:
+                await decrement_meeting_counter(form)
+                raise
 
-            new_meeting = await conn.booking.meeting.insert_one(form)
-            count_doc = await conn.booking.meeting.count_documents({
-                "full_name": form["full_name"],
-                "UID": form["UID"],
-                "meeting_date": form["meeting_date"]
-            })
-            await conn.booking.meeting.update_one({
-                "_id": new_meeting.inserted_id
-            }, {
-                "$set": {
-                    "number_of_meetings": count_doc
-            }}) 
-
-            
             if not new_meeting.inserted_id:
                 raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to book meeting")
             print("Meeting booked successfully") #debugging
-            # data caching after all the validation are done and meeting is booked
-            await cache_meeting(form)
+            # cache, booked day counter, slot index and availability in one MULTI
+            await publish((BOOKED, form))
             return (form)
 
 
-async def set_meeting_slot(UID: str, date: str, form: dict):
-    meeting_key = f"meeting_available_slot:{form['date']}:{form['UID']}"
-    redis_data = {k: json.dumps(v, cls=CustomJSONEncoder) if isinstance(v, (dict, list)) else v 
-                      for k, v in form.items()}
-    await client.hset(meeting_key, mapping=redis_data)
-    await client.expire(meeting_key, 8 * 24 * 60 * 60)  # Cache for 7 days
-    logger.info(f"Meeting slot cached successfully for {UID} on {date}")
-    print("Free meeting slot cached successfully")
-
-
-async def get_meeting_slot(date: str, UID: str):
-    meeting_key = f"meeting_available_slot:{date}:{UID}"
-    cached_data = await client.hgetall(meeting_key)
-    if cached_data:
-        print("Meeting slots fetched from cache")
-        return {
-            "UID": cached_data["UID"],
-            "date": cached_data["date"],
-            "working_hours": json.loads(cached_data["working_hours"]),
-            "working_days": json.loads(cached_data["working_days"]),
-            "holidays": json.loads(cached_data["holidays"]),
-            "working_address": json.loads(cached_data["working_address"]),
-            "avg_meeting_duration":cached_data["avg_meeting_duration"],
-            "available_slots": json.loads(cached_data["available_slots"])
-        }
-    else:
-        print("No meeting slots available in cache")
-        return None
-    
-async def get_busy_date(UID: str):
-    pattern = f"busy_date:{UID}:*"
-    try:
-        keys = await client.keys(pattern)
-        if not keys:
-            return None
-
-        key = keys[0]
-        cached_data = await client.hgetall(key)
-        if not cached_data:
-            return None
-
-        result = {}
-        for k, v in cached_data.items():
-            try:
-                result[k] = json.loads(v)
-            except (json.JSONDecodeError, TypeError):
-                result[k] = v
-        return result
-    except Exception as e:
-        logger.error(f"Error getting cached busy date: {str(e)}")
-        return None
-
-
-
-async def set_busy_date(UID: str, today: str, form: dict):
-    """Cache busy date data"""
-    key = f"busy_date:{UID}:{today}"
-    try:
-        redis_data = {k: json.dumps(v, cls=CustomJSONEncoder) if isinstance(v, (dict, list)) else str(v)
-                      for k, v in form.items()}
-        await client.hset(key, mapping=redis_data)
-        await client.expire(key, 8 * 24 * 60 * 60)  # Cache for 8 days
-        print("Busy date cached successfully")
-        logger.info(f"Busy date cached successfully for {UID}")
-    except Exception as e:
-        logger.error(f"Error caching busy date: {str(e)}")
+def booking_confirmation_html(form_dict: dict):
+    """HTML body of the booking confirmation email"""
+    return f"""
+                        <html>
+<body style="font-family: Arial, sans-serif; margin: 0; padding: 0; background-color: #f4f4f4;">
+    <table width="100%" cellspaUIDg="0" cellpadding="0" style="background-color: #f4f4f4; padding: 20px;">
+        <tr>
+            <td align="center">
+                <table width="600px" cellspaUIDg="0" cellpadding="0" style="background-color: #ffffff; padding: 20px; border-radius: 10px; box-shadow: 0px 0px 10px rgba(0,0,0,0.1);">
+                    <tr>
+                        <td align="center">
+                            <h2 style="color: #2C3E50;">Meeting Confirmation</h2>
+                            <p style="color: #555; font-size: 16px;">Dear <strong>{form_dict['full_name']}</strong>,</p>
+                            <p style="color: #555; font-size: 16px;">Thank you for booking your meeting with <strong>Meet</strong>. Below are your meeting details:</p>
+                        </td>
+                    </tr>
+                    <tr>
+                        <td>
+                            <table width="100%" cellspaUIDg="0" cellpadding="10" style="border-collapse: collapse;">
+                                <tr>
+                                    <td style="background-color: #f8f8f8; color: #333; font-size: 16px; font-weight: bold;">User:</td>
+                                    <td style="color: #555; font-size: 16px;">Dear. {form_dict['full_name']}</td>
+                                </tr>
+                                <tr>
+                                    <td style="background-color: #f8f8f8; color: #333; font-size: 16px; font-weight: bold;">Date:</td>
+                                    <td style="color: #555; font-size: 16px;">{form_dict['meeting_date']}</td>
+                                </tr>
+                                <tr>
+                                    <td style="background-color: #f8f8f8; color: #333; font-size: 16px; font-weight: bold;">Time:</td>
+                                    <td style="color: #555; font-size: 16px;">{form_dict['meeting_time']}</td>
+                                </tr>
+                            </table>
+                        </td>
+                    </tr>
+                    <tr>
+                        <td>
+                            <p style="color: #555; font-size: 16px;">Please arrive at least <strong> 15 minutes</strong> before your scheduled meeting. 
+                            <p style="color: #555; font-size: 16px;">We look forward to assisting you with your healthcare needs.</p>
+                        </td>
+                    </tr>
+                    <tr>
+                        <td align="center" style="padding-top: 20px;">
+                            <p style="color: #777; font-size: 14px;">Best regards,</p>
+                            <p style="color: #2C3E50; font-size: 16px; font-weight: bold;">Meet Team</p>
+                        </td>
+                    </tr>
+                    <tr>
+                        <td align="center" style="padding-top: 30px; border-top: 1px solid #ddd;">
+                            <p style="color: #888; font-size: 12px;">© 2025 Meet. All rights reserved.</p>
+                        </td>
+                    </tr>
+                </table>
+            </td>
+        </tr>
+    </table>
+</body>
+</html>
+        """
 
 
 def authenticate_gmail():
@@ -274,36 +244,12 @@ def send_email_ses(to_email, subject, body, retries=3, delay=5):
             print(f"Error: {traceback.format_exc()}")
             time.sleep(delay)
 
-def send_mail_to_mailhog(to_email, subject, body, retries=3, delay=5):
-    """Send an email using MailHog (local SMTP server) with retry mechanism."""
-    for attempt in range(retries):
-        try:
-            msg = MIMEText(body, "html")
-            msg["Subject"] = subject
-            msg["From"] = NO_REPLY_EMAIL
-            msg["To"] = to_email
-
-            with smtplib.SMTP("localhost", 1025) as server:
-                server.sendmail(NO_REPLY_EMAIL, [to_email], msg.as_string())
-
-            print(f"Email sent to {to_email} via MailHog!")
-            return {"status": "success", "to": to_email}
-        except Exception as e:
-            print(f"Failed to send email to MailHog: {e}. Retrying in {delay} seconds...")
-            print(f"Error: {traceback.format_exc()}")
-            time.sleep(delay)
-            return {"status": "failure", "error": str(e)}
-
-    print("Failed to send email to MailHog after multiple attempts.")
-
-
 def create_new_log(log_type: str, message: str, head: str):
-    url ="http://127.0.0.1:8000/backend/create_new_logs"
+    """Queue a log record for the centralized logging service, never blocks the caller"""
     log = {
          "log_type": log_type,
          "message": message}
     headers = {
         "X-Source-Endpoint": head}
-            
-    resp = requests.post(url, json=log, headers=headers)
-    return resp
\ No newline at end of file
+
+    return log_shipper.submit(log, headers)
\ No newline at end of file
@@ -23,6 +23,12 @@ class cancel(BaseModel):
 class done(BaseModel):
     meeting_id: List[str] = Field(..., title = "Meeting ID")
 
+class common_slots(BaseModel):
+    UIDs: List[str] = Field(..., title = "UIDs of the participants")
+    from_date: str = Field(..., title = "First date")
+    to_date: str = Field(..., title = "Last date")
+    duration: Optional[int] = Field(None, title = "Meeting length in minutes, defaults to the longest avg_meeting_duration")
+
 class Doctor(BaseModel):
     full_name: str = Field(None, title="Full Name of the User")
     email: EmailStr = Field(..., title="Email Address")